@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+
+# Benchmarks for large timetables. Runs without a display. Generates a
+# config file with many events and measures the parts of the program that
+# depend on its size. See "./dt_benchmark.py --help"
+
+from dt_config import ConfigReader, ConfigCleaner
+from dt_execute import ExecutionEvent, ExecutionManager
+from dt_index import OccurrenceIndex, FootnoteIndex
+from dt_layout import TableLayout
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import timeit
+
+# Version of the format of the result file
+RESULT_VERSION = 1
+
+HORIZONS = (1, 7, 30, 365)  # days
+
+
+def make_config_text(recurring_count: int, unique_count: int,
+                     footnote_count: int, dates_per_unique: int,
+                     start: datetime.datetime, seed: int = 0) -> str:
+    # Unique dates and footnote dates spread over the year after start, a
+    # tenth of them already passed. Recurring events use all week
+    # conditions and some of them execute commands.
+    rng = random.Random(seed)
+    lines = ["[general]", "todaycount = 8", "tomorrowcount = 2", ""]
+
+    lines.append("[recurring]")
+    for i in range(recurring_count):
+        hour = rng.randrange(24)
+        minute = rng.randrange(0, 60, 5)
+        days = ["{}{}".format(rng.choice(("", "g", "u")), dow)
+                for dow in rng.sample(range(1, 8), rng.randint(1, 7))]
+        modifiers = rng.choice(([], ["tomorrow"], ["notime"], ["exec"]))
+        lines.append(" ".join(["{}:{:02}".format(hour, minute)] + days +
+                              modifiers))
+        lines.append("Recurring event " + str(i))
+        if "exec" in modifiers:
+            lines.append("+0 ./sound.sh -5 ./display_on.sh")
+        lines.append("")
+
+    lines.append("[unique]")
+    for i in range(unique_count):
+        times = []
+        for _ in range(dates_per_unique):
+            t = start + datetime.timedelta(
+                minutes=5 * rng.randrange(-10000, 100000))
+            times.append(t.strftime("%H:%M-%d.%m.%Y"))
+        lines.append(" ".join(times))
+        lines.append("Unique event " + str(i))
+        lines.append("")
+
+    lines.append("[footnotes]")
+    for i in range(footnote_count):
+        dates = []
+        for _ in range(rng.randint(1, 10)):
+            d = start + datetime.timedelta(days=rng.randrange(-30, 365))
+            dates.append(d.strftime("%d.%m.%Y"))
+        if rng.random() < 0.2:
+            dates.append("yearly")
+        lines.append(" ".join(dates))
+        lines.append("Footnote " + str(i))
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def measure(func, repeat: int) -> float:
+    # best time of one call in seconds
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def bench_parse(filename: str, repeat: int) -> float:
+    # parsing from scratch, as on the first start without cache file
+    return measure(lambda: ConfigReader().parse(filename, "utf-8"), repeat)
+
+
+def bench_expansion(sources: list, start: datetime.datetime, days: int,
+                    repeat: int) -> float:
+    end = start + datetime.timedelta(days=days)
+
+    def expand():
+        for source in sources:
+            source.get_next_simpleevents(start, end)
+
+    return measure(expand, repeat)
+
+
+def bench_clean(filename: str, repeat: int) -> float:
+    # Cleaning as done every night, starting from the parsed config. Every
+    # run cleans a fresh copy of the file.
+    directory = tempfile.mkdtemp()
+    try:
+        copy = os.path.join(directory, "config.cfg")
+        timings = []
+        for _ in range(repeat):
+            shutil.copyfile(filename, copy)
+            cleaner = ConfigCleaner()
+            cleaner.parse(copy, "utf-8")
+            begin = time.perf_counter()
+            cleaner.clean(copy, "utf-8")
+            timings.append(time.perf_counter() - begin)
+        return min(timings)
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_footnotes(footnotes: list, start: datetime.datetime, days: int,
+                    repeat: int) -> float:
+    # building the footnote index and finding the footnotes of every day
+    first = start.date()
+    last = first + datetime.timedelta(days=days)
+
+    def lookup():
+        index = FootnoteIndex()
+        index.build(footnotes)
+        index.footnotes_between(first, last)
+
+    return measure(lookup, repeat)
+
+
+def bench_tick(count: int, repeat: int) -> float:
+    # Time for the execution thread to take count due executions and hand
+    # them to the worker pool. The pool is not started, so nothing runs.
+    timings = []
+    for _ in range(repeat):
+        manager = ExecutionManager(log=lambda s: None)
+        due = datetime.datetime.now() + datetime.timedelta(milliseconds=5)
+        manager.set_events([ExecutionEvent(due, "true")
+                            for _ in range(count)])
+        time.sleep(0.01)
+        begin = time.perf_counter()
+        manager.tick()
+        timings.append(time.perf_counter() - begin)
+    return min(timings)
+
+
+def _get_occurrences(sources: list, start: datetime.datetime,
+                     days: int) -> list:
+    end = start + datetime.timedelta(days=days)
+    index = OccurrenceIndex()
+    index.build(sources, start, end)
+    return index.events_between(start, end)
+
+
+def bench_selection(sources: list, start: datetime.datetime, days: int,
+                    repeat: int) -> float:
+    # Selecting the events to show late in the day, when many past events
+    # have to be removed, like the renderers do on every redraw
+    layout = TableLayout()
+    layout.count_past = 2
+    layout.set_events(_get_occurrences(sources, start, days))
+    now = start.replace(hour=23)
+    return measure(lambda: layout.select_events(now), repeat)
+
+
+def bench_layout(sources: list, start: datetime.datetime, days: int,
+                 repeat: int) -> float:
+    # time to lay out one frame from the occurrences of the given time span
+    layout = TableLayout()
+    layout.texts['untiltext'] = "until"
+    layout.set_events(_get_occurrences(sources, start, days))
+    now = start.replace(hour=12)
+    return measure(lambda: layout.layout(now), repeat)
+
+
+def run(args) -> dict:
+    # Returns the best time of every benchmark in seconds, by name
+    start = datetime.datetime.now().replace(hour=0, minute=0, second=0,
+                                            microsecond=0)
+    text = make_config_text(args.recurring, args.unique, args.footnotes,
+                            args.dates, start, args.seed)
+    results = {}
+
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, "config.cfg")
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(text)
+
+        results["parse"] = bench_parse(filename, args.repeat)
+        config = ConfigReader().parse(filename, "utf-8")
+        results["clean"] = bench_clean(filename, args.repeat)
+    finally:
+        shutil.rmtree(directory)
+
+    sources = config.recurring + config.unique
+    for days in HORIZONS:
+        results["expansion_{}d".format(days)] = bench_expansion(
+            sources, start, days, args.repeat)
+    for days in (5, 60):
+        results["selection_{}d".format(days)] = bench_selection(
+            sources, start, days, args.repeat)
+        results["layout_{}d".format(days)] = bench_layout(
+            sources, start, days, args.repeat)
+    results["footnotes_365d"] = bench_footnotes(config.footnotes, start, 365,
+                                                args.repeat)
+    results["tick"] = bench_tick(args.executions, args.repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recurring", type=int, default=300,
+                        help="number of recurring events")
+    parser.add_argument("--unique", type=int, default=300,
+                        help="number of unique events")
+    parser.add_argument("--dates", type=int, default=50,
+                        help="number of dates of every unique event")
+    parser.add_argument("--footnotes", type=int, default=100,
+                        help="number of footnotes")
+    parser.add_argument("--executions", type=int, default=1000,
+                        help="number of executions due at the same time")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="repetitions, the best one is reported")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the generated config")
+    parser.add_argument("--output", metavar="FILE",
+                        help="also write the results to FILE as JSON")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="show the change against the results in FILE, "
+                             "written by --output before")
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+
+    results = run(args)
+    for name, seconds in results.items():
+        line = "{:16} {:10.3f} ms".format(name, seconds * 1000)
+        if previous.get(name):
+            line += " {:+7.1f} %".format(
+                (seconds / previous[name] - 1) * 100)
+        print(line)
+
+    if args.output:
+        parameters = {name: getattr(args, name)
+                      for name in ("recurring", "unique", "dates",
+                                   "footnotes", "executions", "repeat",
+                                   "seed")}
+        data = {"version": RESULT_VERSION,
+                "time": datetime.datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "parameters": parameters,
+                "results": results}
+        with open(args.output, "w") as f:
+            json.dump(data, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,15 +6,107 @@ from dt_event import Event
 from dt_event import UniqueEvent, UniqueTime
 from dt_event import RecurringEvent, RecurringTime, ExecutionTime
 from dt_event import FootnoteEvent, FootnoteDate
+from dt_index import FootnoteIndex
 from datetime import datetime, date
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+from typing import List
+import hashlib
+import os
+import pickle
 import re
+import shutil
+import tempfile
+import threading
+import traceback
+
+# Read-only result of parsing a config file. Replaced as a whole on reload,
+# so readers never see a partially parsed config.
+ConfigSnapshot = namedtuple("ConfigSnapshot",
+                            "general recurring unique footnotes")
+
+
+def get_footnotes(config: ConfigSnapshot, index: FootnoteIndex,
+                  today: date) -> List[str]:
+    # The footnotes to show today, or the foot text if there are none.
+    # index has to be built from config.footnotes.
+    footnotes = [e.description for e in index.footnotes_on(today)]
+    if not footnotes and "foot" in config.general:
+        footnotes = [config.general["foot"]]
+    return footnotes
+
+
+def get_preview_days(general: dict) -> int:
+    # Days, starting today, whose occurrences are computed, see previewdays.
+    # Today and tomorrow are always needed.
+    return max(int(general.get('previewdays', 5)), 2)
+
+
+def _write_file_atomically(path: str, data: bytes) -> int:
+    # Writes to a temporary file next to path that then replaces path, so
+    # path is never seen half written. If path is a symlink, its target is
+    # replaced and the link kept. Mode and owner of the old file are kept.
+    # Returns the size of the file.
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".",
+                                     suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            size = os.fstat(f.fileno()).st_size
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+            old = os.stat(path)
+            try:
+                os.chown(temp_path, old.st_uid, old.st_gid)
+            except PermissionError:
+                pass  # only root may give files away
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return size
 
 
 class ConfigReader:
     execution_pattern = re.compile(r"(\+|\-)\s*(\d+)\s*([^+-]+)(?:\s|$)")
-
-    def __init__(self):
+    section_pattern = re.compile(r"\[(.*)\]$")
+    time_token_pattern = re.compile(r"(\d+):(\d+)$")
+    day_token_pattern = re.compile(r"([geuo]?)(\d)$")
+    comment_prefixes = ('#', '//', 'rem')
+
+    # The default date formats are parsed without strptime, which is slow
+    # and depends on the locale. Groups are given in the order of the
+    # datetime arguments.
+    date_patterns = {
+        "%H:%M-%d.%m.%Y": (
+            re.compile(r"(?P<hour>\d\d?):(?P<minute>\d\d?)-"
+                       r"(?P<day>\d\d?)\.(?P<month>\d\d?)\.(?P<year>\d{4})$"),
+            ("year", "month", "day", "hour", "minute")),
+        "%d.%m.%Y": (
+            re.compile(r"(?P<day>\d\d?)\.(?P<month>\d\d?)\.(?P<year>\d{4})$"),
+            ("year", "month", "day")),
+    }
+
+    # Increase when the parsed model changes, so old cache files are ignored
+    cache_version = 1
+
+    def __init__(self, cache_suffix: str = None, shared_blocks=None):
+        # If cache_suffix is given, the parsed config is stored next to the
+        # config file, in a file with that suffix, see _load_cache.
+        # Readers given the same shared_blocks mapping (block key: event,
+        # best a weakref.WeakValueDictionary) use the same event objects for
+        # identical blocks, see _get_event.
+        self._cache_suffix = cache_suffix
+        self._shared_blocks = shared_blocks
+        self._source_key = None  # (encoding, size, hash) of the parsed file
+        self._file_general = OrderedDict()  # general values set in the file
         self.general = OrderedDict(
                 uniquedateformat="%H:%M-%d.%m.%Y",
                 footnotedateformat="%d.%m.%Y",
@@ -23,16 +115,7 @@ class ConfigReader:
         self.recurring = []
         self.unique = []
         self.footnotes = []
-
-    def _finish_event(self, line: str, event: Event, section: str) -> None:
-        if section == "recurring":
-            self.recurring.append(event)
-        elif section == "unique":
-            self.unique.append(event)
-        elif section == "footnotes":
-            self.footnotes.append(event)
-        else:
-            raise Exception("Inside unknown section: " + line)
+        self._block_cache = {}  # (section, dateformat, lines): [Event]
 
     def _parse_event_description(self, line: str, event: Event) -> None:
         event.description = line
@@ -66,60 +149,73 @@ class ConfigReader:
                 expectingTime = True
 
     def _parse_recurring_event_times(self, line: str) -> RecurringEvent:
-        hour = -1
-        minute = -1
+        hour = None
+        minute = None
         event = RecurringEvent()
 
-        tokens = line.split()
-        for token in tokens:
-            if ':' in token:  # time
-                split = token.split(':')
-                hour = split[0]
-                minute = split[1]
+        for token in line.split():
+            match = ConfigReader.time_token_pattern.match(token)
+            if match:
+                hour = int(match.group(1))
+                minute = int(match.group(2))
+                if hour > 23 or minute > 59:
+                    raise Exception("Invalid time: " + token)
+                continue
 
-            elif len(token) <= 2:  # day of week
+            match = ConfigReader.day_token_pattern.match(token)
+            if match:
+                if hour is None:
+                    raise Exception("Day of week before time: " + token)
+                if not 1 <= int(match.group(2)) <= 7:
+                    raise Exception("Invalid day of week: " + token)
                 condition = RecurringEvent.CONDITION_NONE
-                if len(token) == 2:
-                    # gerade Wochenzahl / even week number
-                    if token[0] == 'g' or token[0] == 'e':
-                        condition = RecurringEvent.CONDITION_EVEN
-                    # ungerade Wochenzahl / odd week number
-                    elif token[0] == 'u' or token[0] == 'o':
-                        condition = RecurringEvent.CONDITION_ODD
-                    else:
-                        raise Exception("Unkown day condition: " + token)
-                    dow = token[1:]
-                elif len(token) == 1:
-                    dow = token
-
-                t = RecurringTime(int(dow), int(hour), int(minute), condition)
+                # gerade Wochenzahl / even week number
+                if match.group(1) in ('g', 'e'):
+                    condition = RecurringEvent.CONDITION_EVEN
+                # ungerade Wochenzahl / odd week number
+                elif match.group(1) in ('u', 'o'):
+                    condition = RecurringEvent.CONDITION_ODD
+
+                t = RecurringTime(int(match.group(2)), hour, minute,
+                                  condition)
                 event.add_recurring_time(t)
 
             elif token.lower() in RecurringEvent.VALID_MODIFIERS:
                 event.modifiers.append(token.lower())
 
+            elif len(token) == 2 and token[1].isdigit():
+                raise Exception("Unkown day condition: " + token)
+
             else:
-                raise Exception("Unknown identifier: " + token +
-                                " in line: " + line)
+                raise Exception("Unknown identifier: " + token)
 
         return event
 
+    def _parse_datetime(self, token: str, dateformat: str) -> datetime:
+        fast_path = ConfigReader.date_patterns.get(dateformat)
+        if fast_path is None:
+            return datetime.strptime(token, dateformat)
+
+        pattern, groups = fast_path
+        match = pattern.match(token)
+        if match is None:
+            raise ValueError("no match")
+        return datetime(*map(int, match.group(*groups)))
+
     def _parse_unique_event_times(self, line: str,
                                   dateformat: str) -> UniqueEvent:
         event = UniqueEvent()
 
-        tokens = line.split()
-        for token in tokens:
-            token.strip()
+        for token in line.split():
             if token in UniqueEvent.VALID_MODIFIERS:
                 event.modifiers.append(token)
             else:
                 try:
-                    d = datetime.strptime(token, dateformat)
-                    t = UniqueTime(d.day, d.month, d.year, d.hour, d.minute)
-                    event.add_unique_time(t)
+                    d = self._parse_datetime(token, dateformat)
                 except ValueError:
                     raise Exception("Error parsing: " + token)
+                event.add_unique_time(UniqueTime(d.day, d.month, d.year,
+                                                 d.hour, d.minute))
 
         return event
 
@@ -127,199 +223,288 @@ class ConfigReader:
                                     dateformat: str) -> FootnoteEvent:
         event = FootnoteEvent()
 
-        tokens = line.split()
-        for token in tokens:
-            token.strip()
+        for token in line.split():
             if token in FootnoteEvent.VALID_MODIFIERS:
                 event.modifiers.append(token)
             else:
                 try:
-                    d = datetime.strptime(token, dateformat)
-                    t = FootnoteDate(d.day, d.month, d.year)
-                    event.add_footnote_date(t)
+                    d = self._parse_datetime(token, dateformat)
                 except ValueError:
                     raise Exception("Error parsing: " + token)
+                event.add_footnote_date(FootnoteDate(d.day, d.month, d.year))
 
         return event
 
-    def parse(self, filename: str, encoding: str) -> None:
-        self.recurring = []
-        self.unique = []
-        self.footnotes = []
+    def _has_execution_line(self, line: str, section: str) -> bool:
+        # same as checking for the exec modifier after parsing the line
+        if section == "recurring":
+            return "exec" in line.lower().split()
+        return "exec" in line.split()
+
+    def _parse_block(self, block: tuple, section: str,
+                     general: dict) -> Event:
+        if section == "recurring":
+            event = self._parse_recurring_event_times(block[0])
+        elif section == "unique":
+            event = self._parse_unique_event_times(
+                    block[0],
+                    general['uniquedateformat']
+            )
+        else:
+            event = self._parse_footnote_event_times(
+                    block[0],
+                    general['footnotedateparseformat'],
+            )
+
+        self._parse_event_description(block[1], event)
+        if len(block) > 2:
+            self._parse_execution_line(block[2], event)
+        return event
+
+    def _get_event(self, block_key: tuple, old_cache: dict, used: set,
+                   general: dict, line_number: int) -> Event:
+        # Reuses the event of the same block from the last parse or from
+        # another reader sharing the blocks. An event object is used only
+        # once per config, further identical blocks are parsed again.
+        reusable = old_cache.get(block_key)
+        if reusable:
+            return reusable.pop()
+
+        if self._shared_blocks is not None:
+            shared = self._shared_blocks.get(block_key)
+            if shared is not None and id(shared) not in used:
+                return shared
+
+        try:
+            event = self._parse_block(block_key[2], block_key[0], general)
+        except Exception as e:
+            raise Exception("Line {}: {}".format(line_number, e))
+        if self._shared_blocks is not None:
+            self._shared_blocks.setdefault(block_key, event)
+        return event
+
+    def _get_block_key(self, block: tuple, section: str,
+                       general: dict) -> tuple:
+        dateformat = None
+        if section == "unique":
+            dateformat = general['uniquedateformat']
+        elif section == "footnotes":
+            dateformat = general['footnotedateparseformat']
+        return (section, dateformat, block)
+
+    def parse(self, filename: str, encoding: str) -> ConfigSnapshot:
+        # Unchanged files are not parsed again, also not after a restart if
+        # the cache file is used. Otherwise the file is read line by line.
+        # Events are parsed in blocks of their two or three lines. Blocks
+        # that did not change since the last parse reuse the already parsed
+        # event, so on a reload, only changed events are parsed again and
+        # the event objects of unchanged ones stay the same.
+        # Nothing is changed if parsing fails. Errors name the line.
+        size = os.stat(filename).st_size
+        if self._load_cache(filename, encoding, size):
+            return self.snapshot()
+
+        general = OrderedDict(self.general)
+        file_general = OrderedDict()    # only the values set in this file
+        events = {"recurring": [], "unique": [], "footnotes": []}
+        # events are taken from a copy, so a failed parse keeps the cache
+        old_cache = {key: list(events)
+                     for key, events in self._block_cache.items()}
+        new_cache = {}
+        used = set()                    # ids of the events in this config
+        file_hash = hashlib.sha256()
+
         with open(filename, "r", encoding=encoding) as f:
             section = "general"
-            currentEvent = Event()
-            expectingEventDescription = False
-            expectingExecutionLine = False
-            eventDone = False
+            block = []
+            block_length = 0
+            block_start = 0     # line number of the first line of the block
 
-            for line in f.readlines():
+            for number, line in enumerate(f, 1):
+                file_hash.update(line.encode("utf-8"))
                 line = line.strip()
                 # allow empty description lines
+                expectingEventDescription = len(block) == 1
                 if not line and not expectingEventDescription:
                     continue
 
                 # allow comments
-                if any(line.startswith(chars) for chars in ('#', '//', 'rem')):
+                if line.startswith(ConfigReader.comment_prefixes):
                     continue
 
-                if expectingEventDescription:
-                    self._parse_event_description(line, currentEvent)
-                    expectingEventDescription = False
-
-                    expectingExecutionLine = "exec" in currentEvent.modifiers
-                    eventDone = not expectingExecutionLine
-
-                elif expectingExecutionLine:
-                    self._parse_execution_line(line, currentEvent)
-                    expectingExecutionLine = False
-                    eventDone = True
+                if block:
+                    block.append(line)
+                    if len(block) < block_length:
+                        continue
+
+                    block_key = self._get_block_key(tuple(block), section,
+                                                    general)
+                    event = self._get_event(block_key, old_cache, used,
+                                            general, block_start)
+                    used.add(id(event))
+                    new_cache.setdefault(block_key, []).append(event)
+                    events[section].append(event)
+                    block = []
+                    continue
 
-                elif line[0] is '[' and line[-1] is ']':
-                    section = line[1:-1]
+                match = ConfigReader.section_pattern.match(line)
+                if match:
+                    section = match.group(1)
 
                 elif section == "general":
                     splits = line.split('=', maxsplit=1)
                     if len(splits) == 2:
                         key = splits[0].strip().lower()
-                        self.general[key] = splits[1].strip()
+                        general[key] = splits[1].strip()
+                        file_general[key] = general[key]
                     else:
-                        raise Exception("Invalid general line: " + line)
-
-                elif section == "recurring":
-                    currentEvent = self._parse_recurring_event_times(line)
-                    expectingEventDescription = True
-
-                elif section == "unique":
-                    currentEvent = self._parse_unique_event_times(
-                            line,
-                            self.general['uniquedateformat']
-                    )
-                    expectingEventDescription = True
-
-                elif section == "footnotes":
-                    currentEvent = self._parse_footnote_event_times(
-                            line,
-                            self.general['footnotedateparseformat'],
-                    )
-                    expectingEventDescription = True
-
-                if eventDone:
-                    self._finish_event(line, currentEvent, section)
-                    eventDone = False
+                        raise Exception("Line {}: Invalid general line: {}"
+                                        .format(number, line))
+
+                elif section in events:
+                    block = [line]
+                    block_start = number
+                    block_length = 2
+                    if self._has_execution_line(line, section):
+                        block_length = 3
+
+        self.general = general
+        self.recurring = events["recurring"]
+        self.unique = events["unique"]
+        self.footnotes = events["footnotes"]
+        self._block_cache = new_cache
+        self._source_key = (encoding, size, file_hash.hexdigest())
+        self._file_general = file_general
+        self._write_cache(filename)
+        return self.snapshot()
+
+    def _hash_file(self, filename: str, encoding: str) -> str:
+        # same as the hash computed while parsing
+        file_hash = hashlib.sha256()
+        with open(filename, "r", encoding=encoding) as f:
+            for line in f:
+                file_hash.update(line.encode("utf-8"))
+        return file_hash.hexdigest()
+
+    def _load_cache(self, filename: str, encoding: str, size: int) -> bool:
+        # Uses the result of an earlier parse of the same content, from
+        # memory or from the cache file. The size is compared first so
+        # changed files usually are not read twice. The modification time is
+        # not trusted: touching the file does not change the content, and on
+        # file systems with coarse timestamps it misses quick edits.
+        # Returns whether the config was loaded.
+        cache = None
+        known = self._source_key is not None
+        if not known or self._source_key[:2] != (encoding, size):
+            cache = self._read_cache_file(filename)
+            if cache is None or cache['key'][:2] != (encoding, size):
+                return False
+
+        key = (encoding, size, self._hash_file(filename, encoding))
+        if key == self._source_key:
+            return True
+        if cache is None:
+            cache = self._read_cache_file(filename)
+        if cache is None or cache['key'] != key:
+            return False
+
+        general = OrderedDict(self.general)
+        general.update(cache['general'])
+        self.general = general
+        self.recurring = cache['recurring']
+        self.unique = cache['unique']
+        self.footnotes = cache['footnotes']
+        self._block_cache = cache['blocks']
+        self._source_key = key
+        self._file_general = cache['general']
+        return True
+
+    def _read_cache_file(self, filename: str) -> dict:
+        if self._cache_suffix is None:
+            return None
+        try:
+            with open(filename + self._cache_suffix, "rb") as f:
+                cache = pickle.load(f)
+            if cache['version'] == ConfigReader.cache_version:
+                return cache
+        except Exception:
+            pass  # missing or damaged, the config is parsed instead
+        return None
+
+    def _write_cache(self, filename: str) -> None:
+        # Events are pickled together with the block cache, which refers to
+        # the same event objects.
+        if self._cache_suffix is None:
+            return
+        cache = {'version': ConfigReader.cache_version,
+                 'key': self._source_key,
+                 'general': self._file_general,
+                 'recurring': self.recurring,
+                 'unique': self.unique,
+                 'footnotes': self.footnotes,
+                 'blocks': self._block_cache}
+        try:
+            _write_file_atomically(
+                filename + self._cache_suffix,
+                pickle.dumps(cache, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            pass  # the cache only saves time, the config was parsed anyway
+
+    def snapshot(self) -> ConfigSnapshot:
+        return ConfigSnapshot(MappingProxyType(OrderedDict(self.general)),
+                              tuple(self.recurring),
+                              tuple(self.unique),
+                              tuple(self.footnotes))
 
 
 class ConfigWriter():
-    def _has_passed(self, t: datetime) -> bool:
-        n = datetime.now()
-        return n > t
+    _condition_prefixes = {RecurringEvent.CONDITION_NONE: "",
+                           RecurringEvent.CONDITION_EVEN: "g",
+                           RecurringEvent.CONDITION_ODD: "u"}
+
+    def _get_modifiers_string(self, event: Event) -> str:
+        return "".join(" " + modifier for modifier in event.modifiers)
 
     def _get_recurring_string(self, event: RecurringEvent) -> str:
-        line = ""
-        added = []
-        times = event.get_recurring_times()
-        firsttime = True
-
-        for time in times:
-            if time not in added:
-                if not firsttime:
-                    line += " "
-                else:
-                    firsttime = False
-
-                line += str(time.hour).zfill(2) + ":"
-                line += str(time.minute).zfill(2) + " "
-                if time.condition == RecurringEvent.CONDITION_EVEN:
-                    line += "g"
-                elif time.condition == RecurringEvent.CONDITION_ODD:
-                    line += "u"
-                elif not time.condition == RecurringEvent.CONDITION_NONE:
-                    raise("Fehler")
-
-                line += str(time.dow)
-                added.append(time)
-
-                for inner in times:
-                    if (inner not in added and
-                            inner.hour == time.hour and
-                            inner.minute == time.minute):
-                        line += " "
-                        if inner.condition == RecurringEvent.CONDITION_EVEN:
-                            line += "g"
-                        elif inner.condition == RecurringEvent.CONDITION_ODD:
-                            line += "u"
-                        elif inner.condition != RecurringEvent.CONDITION_NONE:
-                            raise("Fehler")
-                        line += str(inner.dow)
-                        added.append(inner)
-
-        for modifier in event.modifiers:
-            line += " " + modifier
-
-        return line
+        # Days with the same time are grouped behind that time, in the order
+        # the times first occur. Duplicate times are written once.
+        groups = OrderedDict()  # (hour, minute): {RecurringTime: None}
+        for time in event.get_recurring_times():
+            groups.setdefault((time.hour, time.minute), {})[time] = None
+
+        parts = []
+        for (hour, minute), times in groups.items():
+            days = []
+            for time in times:
+                prefix = self._condition_prefixes.get(time.condition)
+                if prefix is None:
+                    raise Exception("Unknown condition: " +
+                                    str(time.condition))
+                days.append(prefix + str(time.dow))
+            parts.append("{:02}:{:02} {}".format(hour, minute,
+                                                 " ".join(days)))
+
+        return " ".join(parts) + self._get_modifiers_string(event)
 
     def _get_unique_string(self, event: UniqueEvent, dateformat: str) -> str:
-        line = ""
-        added = []
-        times = event.get_unique_times()
-        firsttime = True
-
-        for time in times:
-            if time not in added:
-                t = datetime(time.year, time.month, time.day,
-                             time.hour, time.minute)
-
-                if not self._has_passed(t):
-
-                    if firsttime:
-                        firsttime = False
-                    else:
-                        line += " "
-
-                    line += t.strftime(dateformat)
-
-                added.append(time)
-
-        for modifier in event.modifiers:
-            line += " " + modifier
-
-        return line
+        now = datetime.now()
+        times = (datetime(time.year, time.month, time.day,
+                          time.hour, time.minute)
+                 for time in dict.fromkeys(event.get_unique_times()))
+        line = " ".join(t.strftime(dateformat) for t in times if t >= now)
+        return line + self._get_modifiers_string(event)
 
     def _get_footnotes_string(self, event: FootnoteEvent,
                               dateformat: str) -> str:
-        line = ""
-        added = []
-        dates = event.get_footnote_dates()
-        firstdate = True
-
-        for d in dates:
-            if d not in added:
-                if firstdate:
-                    firstdate = False
-                else:
-                    line += " "
-
-                line += (
-                    date(day=d.day, month=d.month, year=d.year)
-                    .strftime(dateformat)
-                )
-
-                added.append(d)
-
-        for modifier in event.modifiers:
-            line += " " + modifier
-
-        return line
+        dates = dict.fromkeys(event.get_footnote_dates())
+        line = " ".join(date(day=d.day, month=d.month, year=d.year)
+                        .strftime(dateformat) for d in dates)
+        return line + self._get_modifiers_string(event)
 
     def _get_executions_string(self, event: Event) -> str:
-        line = ""
-
-        for time in event.execution_times:
-            if time.offset >= 0:
-                line += "+"
-            line += str(time.offset) + " " + time.executable + " "
-
-        return line
+        return "".join("{}{} {} ".format("+" if time.offset >= 0 else "",
+                                         time.offset, time.executable)
+                       for time in event.execution_times)
 
     def _build_lines(self, general: dict,
                      recurring: list,
@@ -368,18 +553,63 @@ class ConfigWriter():
 
     def write(self, filename: str, general: dict,
               recurring: list, unique: list, footnotes: list,
-              encoding: str) -> None:
+              encoding: str) -> int:
+        # The file is replaced as a whole, see _write_file_atomically.
+        # Returns the size of the written file.
         lines = self._build_lines(general, recurring, unique, footnotes)
-        with open(filename, 'w', encoding=encoding) as f:
-            f.write('\n'.join(lines))
+        return _write_file_atomically(filename,
+                                      '\n'.join(lines).encode(encoding))
 
 
 class ConfigCleaner(ConfigReader, ConfigWriter):
-    def init(self):
-        ConfigReader.init(self)
-        ConfigWriter.init(self)
-
+    # Removes past dates from the config file. Used as the reader of the
+    # config file, so cleaning can start from the already parsed config.
     def clean(self, filename: str, encoding: str) -> None:
+        # Parsing only reads the file if it did not change since the last
+        # parse. The written file is parsed again, so the parsed config and
+        # the cache file match it and hold no past dates. Blocks that were
+        # written as they were keep their events.
         self.parse(filename, encoding)
         self.write(filename, self.general, self.recurring, self.unique,
                    self.footnotes, encoding)
+        self.parse(filename, encoding)
+
+
+class CleanThread:
+    # Cleans a config file in its own thread, so cleaning a large config
+    # does not hold up updates. The previous version is kept with the
+    # suffix ".bak". Parsing with the cleaner has to hold lock as well.
+    def __init__(self, cleaner: ConfigCleaner, lock: threading.Lock, log):
+        self._cleaner = cleaner
+        self._lock = lock
+        self._log = log
+        self._thread = None
+
+    def start(self, filename: str, encoding: str, done=None) -> None:
+        # done is called once the file is cleaned
+        if self._thread is not None and self._thread.is_alive():
+            self._log("!!! Cleaning {} from the last time did not finish "
+                      "yet.".format(filename))
+            return
+        self._thread = threading.Thread(target=self._clean,
+                                        args=(filename, encoding, done),
+                                        daemon=True)
+        self._thread.start()
+
+    def join(self, timeout: float = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _clean(self, filename: str, encoding: str, done) -> None:
+        self._log("Cleaning {}...".format(filename))
+        try:
+            with self._lock:
+                shutil.copyfile(filename, filename + ".bak")
+                self._cleaner.clean(filename, encoding)
+        except Exception:
+            self._log("!!! Cleaning {} failed. Error:".format(filename))
+            traceback.print_exc()
+            return
+        self._log("Cleaned {}.".format(filename))
+        if done is not None:
+            done()
@@ -4,8 +4,10 @@
 
 from collections import namedtuple
 from datetime import datetime, timedelta, date
-from typing import List
+from typing import Iterator, List
+from itertools import repeat, takewhile
 from dt_execute import ExecutionEvent
+import heapq
 
 UniqueTime = namedtuple("UniqueTime", "day month year hour minute")
 RecurringTime = namedtuple("RecurringTime", "dow hour minute condition")
@@ -14,33 +16,76 @@ FootnoteDate = namedtuple("FootnoteDate", "day month year")
 
 
 class Event:
+    # modifiers as bit flags, see get_modifier_flags
+    FLAG_NOTIME = 1 << 0
+    FLAG_UNTIL = 1 << 1
+    FLAG_TOMORROW = 1 << 2
+    FLAG_PADDING = 1 << 3
+    FLAG_EXEC = 1 << 4
+    FLAG_NODRAW = 1 << 5
+    FLAG_NOREMOVE = 1 << 6
+    FLAG_YEARLY = 1 << 7
+
+    # flag of each modifier, also the modifiers the config may use
+    _modifier_flags = {"notime": FLAG_NOTIME,
+                       "until": FLAG_UNTIL,
+                       "tomorrow": FLAG_TOMORROW,
+                       "padding": FLAG_PADDING,
+                       "exec": FLAG_EXEC,
+                       "nodraw": FLAG_NODRAW,
+                       "noremove": FLAG_NOREMOVE,
+                       "yearly": FLAG_YEARLY}
     # todo: Split this up so each class has its own list of valid modifiers
     # so the check on the config are more helpful
-    VALID_MODIFIERS = ["notime", "until", "tomorrow", "padding", "exec",
-                       "nodraw", "noremove", "yearly"]
+    VALID_MODIFIERS = list(_modifier_flags)
 
     def __init__(self):
         self.description = ""
         self.modifiers = []
         self.execution_times = []
 
-
-class SimpleEvent(Event):
-    def __init__(self):
-        Event.__init__(self)
-        self.time = datetime.now()
+    def get_modifier_flags(self) -> int:
+        flags = 0
+        for modifier in self.modifiers:
+            flags |= Event._modifier_flags[modifier]
+        return flags
+
+    def _get_simpleevents(self, times: List[datetime]) -> List["SimpleEvent"]:
+        flags = self.get_modifier_flags()
+        return [SimpleEvent(time, self.description, flags,
+                            self.execution_times)
+                for time in times]
+
+    def iter_simpleevents(self, start: datetime) -> Iterator["SimpleEvent"]:
+        # Lazily yields the occurrences after start, sorted by time. Callers
+        # stop pulling once they reached the end of the time span they need.
+        flags = self.get_modifier_flags()
+        for time in self.iter_datetimes(start):
+            yield SimpleEvent(time, self.description, flags,
+                              self.execution_times)
+
+
+class SimpleEvent:
+    # A single occurrence of an event. There are a lot of these for long
+    # previews, so they are kept small: The modifiers are stored as bit flags
+    # and the description and execution times are shared with the event.
+    __slots__ = ("time", "description", "flags", "execution_times")
+
+    def __init__(self, time: datetime, description: str = "", flags: int = 0,
+                 execution_times: list = ()):
+        self.time = time
+        self.description = description
+        self.flags = flags
+        self.execution_times = execution_times
 
     def timestring(self) -> str:
         return "{dt.hour}:{dt.minute:02}".format(dt=self.time)
 
     def get_execution_events(self) -> List[ExecutionEvent]:
-        event_list = []
-        for execution_time in self.execution_times:
-            e = ExecutionEvent()
-            e.time = self.time + timedelta(minutes=execution_time.offset)
-            e.executable = execution_time.executable
-            event_list.append(e)
-        return event_list
+        return [ExecutionEvent(
+                    self.time + timedelta(minutes=execution_time.offset),
+                    execution_time.executable)
+                for execution_time in self.execution_times]
 
 
 class RecurringEvent(Event):
@@ -69,8 +114,63 @@ class RecurringEvent(Event):
             c_met = (d.isocalendar()[1] % 2 == 0)
         return (c_met and d.isoweekday() == t.dow)
 
+    @staticmethod
+    def _week_matches_condition(d: date, condition: int) -> bool:
+        if condition == RecurringEvent.CONDITION_ODD:
+            return d.isocalendar()[1] % 2 == 1
+        if condition == RecurringEvent.CONDITION_EVEN:
+            return d.isocalendar()[1] % 2 == 0
+        return True
+
+    @staticmethod
+    def _iter_recurring_time(t: RecurringTime,
+                             start: datetime) -> Iterator[datetime]:
+        # Jump to the first matching weekday, then step by whole weeks
+        # (or two weeks if the week number parity matters). Never ends.
+        matches = RecurringEvent._week_matches_condition
+        week = timedelta(days=7)
+
+        d = start + timedelta(days=(t.dow - start.isoweekday()) % 7)
+        d = d.replace(hour=t.hour, minute=t.minute)
+        if d <= start:
+            d = d + week
+
+        step = week
+        if t.condition != RecurringEvent.CONDITION_NONE:
+            step = 2 * week
+            while not matches(d, t.condition):
+                d = d + week
+
+        while True:
+            yield d
+            d = d + step
+            if step != week and not matches(d, t.condition):
+                # ISO years with 53 weeks break the alternation: two odd
+                # weeks follow each other (53, 1) and two even weeks are
+                # three weeks apart (52, 2).
+                d = d - week if matches(d - week, t.condition) else d + week
+
+    def _iter_indexed_datetimes(self, start: datetime) -> Iterator[tuple]:
+        # (datetime, index of the recurring time), sorted
+        streams = [zip(self._iter_recurring_time(t, start), repeat(index))
+                   for index, t in enumerate(self._times)]
+        return heapq.merge(*streams)
+
+    def iter_datetimes(self, start: datetime) -> Iterator[datetime]:
+        return (d for d, index in self._iter_indexed_datetimes(start))
+
     def get_next_datetimes(self, start: datetime,
                            end: datetime) -> List[datetime]:
+        times = takewhile(lambda entry: entry[0] < end,
+                          self._iter_indexed_datetimes(start))
+        # same order as the day-by-day scan: by day, then by time entry
+        times = sorted(times, key=lambda entry: (entry[0].date(), entry[1]))
+        return [entry[0] for entry in times]
+
+    def _get_next_datetimes_scan(self, start: datetime,
+                                 end: datetime) -> List[datetime]:
+        # Reference implementation checking every single day, kept to
+        # verify get_next_datetimes against.
         date = start
         times = []
         while date < end:
@@ -84,16 +184,7 @@ class RecurringEvent(Event):
 
     def get_next_simpleevents(self, start: datetime,
                               end: datetime) -> List[SimpleEvent]:
-        times = self.get_next_datetimes(start, end)
-        events = []
-        for time in times:
-            e = SimpleEvent()
-            e.time = time
-            e.description = self.description
-            e.modifiers = self.modifiers
-            e.execution_times = self.execution_times
-            events.append(e)
-        return events
+        return self._get_simpleevents(self.get_next_datetimes(start, end))
 
 
 class UniqueEvent(Event):
@@ -117,18 +208,12 @@ class UniqueEvent(Event):
                 times.append(dt)
         return times
 
+    def iter_datetimes(self, start: datetime) -> Iterator[datetime]:
+        return iter(sorted(self.get_next_datetimes(start, datetime.max)))
+
     def get_next_simpleevents(self, start: datetime,
                               end: datetime) -> List[SimpleEvent]:
-        times = self.get_next_datetimes(start, end)
-        events = []
-        for time in times:
-            e = SimpleEvent()
-            e.time = time
-            e.description = self.description
-            e.modifiers = self.modifiers
-            e.execution_times = self.execution_times
-            events.append(e)
-        return events
+        return self._get_simpleevents(self.get_next_datetimes(start, end))
 
 
 class FootnoteEvent(Event):
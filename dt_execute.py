@@ -1,43 +1,196 @@
 #!/usr/bin/python3
 
+import dt_settings
+from dt_stats import stats
+
 import datetime
+import heapq
+import os
+import queue
+import signal
 import subprocess
 import threading
+import time
 
 
 class ExecutionEvent:
-    def __init__(self):
-        self.time = datetime.datetime.now()
-        self.executable = ''
+    __slots__ = ("time", "executable")
+
+    def __init__(self, time: datetime.datetime, executable: str):
+        self.time = time
+        self.executable = executable
 
     def appropriate(self) -> bool:
         return datetime.datetime.now() >= self.time
 
-    def execute(self) -> None:
-        subprocess.Popen(self.executable.split(' '))
+    def spawn(self) -> subprocess.Popen:
+        # The command gets its own process group, so it can be killed
+        # together with everything it started, see kill_process_group.
+        return subprocess.Popen(self.executable.split(' '),
+                                start_new_session=True)
+
+    def execute(self, timeout: float = None) -> int:
+        # Runs the command, waits for it and returns its exit code. Commands
+        # that run longer than timeout seconds are killed.
+        return wait_or_kill(self.spawn(), timeout)
+
+
+def kill_process_group(process: subprocess.Popen) -> None:
+    # Killing only the process would leave e.g. the player started by a
+    # script running
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass  # all processes of the group ended already
+
+
+def wait_or_kill(process: subprocess.Popen, timeout: float) -> int:
+    try:
+        return process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        kill_process_group(process)
+        process.wait()
+        raise
+
+
+class ExecutionPool:
+    # Runs commands on a fixed number of worker threads, so a burst of
+    # executions can't start more than max_workers processes at once. Every
+    # process is waited for, so no zombies are left behind.
+    def __init__(self, max_workers: int, timeout: float, log=print):
+        self._timeout = timeout
+        self._log = log
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()       # guards both below
+        self._running = set()               # subprocess.Popen
+        self._stopping = False
+        self._workers = [threading.Thread(target=self._work, daemon=True)
+                         for _ in range(max_workers)]
+
+    def _run(self, event: ExecutionEvent) -> None:
+        start = time.monotonic()
+        try:
+            with self._lock:
+                if self._stopping:
+                    return
+                process = event.spawn()
+                self._running.add(process)
+            # how late the command started, e.g. because all workers were
+            # busy
+            stats.add_timing("execution delay", max(
+                (datetime.datetime.now() - event.time).total_seconds(), 0))
+            try:
+                code = wait_or_kill(process, self._timeout)
+            finally:
+                with self._lock:
+                    self._running.discard(process)
+        except subprocess.TimeoutExpired:
+            self._log("Killed after {:.0f} s: {}".format(self._timeout,
+                                                         event.executable))
+        except OSError as e:
+            self._log("Couldn't execute: " + str(e))
+        else:
+            if self._stopping and code == -signal.SIGKILL:
+                self._log("Killed on exit: " + event.executable)
+                return
+            self._log("Executed in {:.1f} s with exit code {}: {}".format(
+                    time.monotonic() - start, code, event.executable))
+
+    def _work(self) -> None:
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            self._run(event)
+
+    def submit(self, event: ExecutionEvent) -> None:
+        self._queue.put(event)
+
+    def start(self) -> None:
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self) -> None:
+        # Drops the queued commands and kills the running ones, so exiting
+        # does not wait for them
+        with self._lock:
+            self._stopping = True
+            running = list(self._running)
+        for process in running:
+            kill_process_group(process)
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
 
 
 class ExecutionManager:
-    def __init__(self):
-        self.events = []  # List of dt_event.ExecutionEvents
-        self.event_lock = threading.Lock()
-        self.events_changed = threading.Event()
+    # Runs the execution events on its own thread. The thread sleeps until
+    # the next event is due or the events are replaced.
+    def __init__(self, log=print):
+        self._log = log
+        self._pool = ExecutionPool(dt_settings.execution_max_processes,
+                                   dt_settings.execution_timeout_s, log)
+        self._heap = []  # (time, sequence number, ExecutionEvent)
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def set_events(self, events: list) -> None:
+        # events that are already due are dropped, not executed
+        now = datetime.datetime.now()
+        heap = [(e.time, i, e) for i, e in enumerate(events) if e.time > now]
+        heapq.heapify(heap)
+        with self._condition:
+            self._heap = heap
+            self._condition.notify()
 
-    def _clean_and_sort_events(self) -> None:
-        self.events.sort(key=lambda x: x.time)
-        while self.events and self.events[0].appropriate():
-            self.events.pop(0)
+    def _pop_due_events(self) -> list:
+        now = datetime.datetime.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def _get_wait_time(self) -> float:
+        if not self._heap:
+            return dt_settings.execution_max_wait_s
+        wait = (self._heap[0][0] - datetime.datetime.now()).total_seconds()
+        # Waiting uses a monotonic clock, so wake up now and then to notice
+        # changes of the system time.
+        return min(max(wait, 0), dt_settings.execution_max_wait_s)
+
+    def _execute(self, events: list) -> None:
+        if not events:
+            return
+        with stats.measure("dispatch"):
+            for event in events:
+                self._pool.submit(event)
+        stats.count("executions", len(events))
 
     def tick(self) -> None:
-        with self.event_lock:
-            if self.events_changed.isSet():
-                self._clean_and_sort_events()
-                self.events_changed.clear()
-
-            while self.events:
-                if not self.events[0].appropriate():
-                    break
-                try:
-                    self.events[0].execute()
-                finally:
-                    self.events.pop(0)
+        with self._condition:
+            due = self._pop_due_events()
+        self._execute(due)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                due = self._pop_due_events()
+                if not due:
+                    self._condition.wait(self._get_wait_time())
+                    continue
+            self._execute(due)
+
+    def start(self) -> None:
+        self._pool.start()
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+        self._pool.stop()
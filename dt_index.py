@@ -0,0 +1,255 @@
+#!/usr/bin/python3
+
+# Time ordered index of the occurrences of all events. Built once per config
+# load and extended when the previewed time span moves forward. The
+# occurrences are pulled lazily from one merged stream over all events, so
+# extending the index only generates the occurrences it needs.
+# FootnoteIndex finds the footnotes of a day without looking at the others.
+
+from dt_event import SimpleEvent, FootnoteEvent
+from dt_execute import ExecutionEvent
+from datetime import date, datetime, timedelta
+from bisect import bisect_left
+from typing import Dict, Iterator, List
+from dt_stats import stats
+from itertools import takewhile
+import heapq
+
+
+def get_preview_timespan(days: int) -> tuple:
+    # From midnight today on, see dt_config.get_preview_days
+    start = datetime.now().replace(hour=0, minute=0, second=0,
+                                   microsecond=0)
+    return start, start + timedelta(days=days)
+
+
+def get_seconds_until_tomorrow() -> float:
+    now = datetime.now()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1),
+                                datetime.min.time())
+    return (tomorrow - now).total_seconds()
+
+
+def _entry_key(entry: tuple) -> tuple:
+    return entry[:2]  # time, position of the source
+
+
+class OccurrenceIndex:
+    def __init__(self):
+        self._sources = []          # dt_event.RecurringEvent / UniqueEvent
+        self._positions = {}        # id(source): position in the config
+        self._start = None
+        self._end = None
+        self._stream = iter(())     # entries from _end on, see _reset_stream
+        self._pending = None        # entry taken from _stream, not added yet
+
+        # parallel lists, sorted by time and then by position of the source
+        self._events = []           # SimpleEvent
+        self._event_times = []
+        self._event_sources = []
+        self._executions = []       # ExecutionEvent
+        self._execution_times = []
+        self._execution_sources = []
+
+    def _set_sources(self, sources: list) -> None:
+        self._sources = list(sources)
+        self._positions = {id(s): i for i, s in enumerate(self._sources)}
+
+    def _iter_entries(self, source, start: datetime) -> Iterator[tuple]:
+        # iter_simpleevents excludes its start, but occurrences exactly at
+        # start belong to the time span. Event times are at full minutes.
+        position = self._positions[id(source)]
+        after = start - timedelta(minutes=1)
+        for event in source.iter_simpleevents(after):
+            yield (event.time, position, source, event)
+
+    def _merge_entries(self, sources: list,
+                       start: datetime) -> Iterator[tuple]:
+        return heapq.merge(*[self._iter_entries(source, start)
+                             for source in sources], key=_entry_key)
+
+    def _reset_stream(self, start: datetime) -> None:
+        self._stream = self._merge_entries(self._sources, start)
+        self._pending = next(self._stream, None)
+
+    def _take_entries(self, end: datetime) -> list:
+        # entries from the stream up to end, sorted
+        entries = []
+        with stats.measure("expansion"):
+            entry = self._pending
+            while entry is not None and entry[0] < end:
+                entries.append(entry)
+                entry = next(self._stream, None)
+            self._pending = entry
+        stats.count("occurrences", len(entries))
+        return entries
+
+    def _set_event_entries(self, entries: list) -> None:
+        self._event_times = [entry[0] for entry in entries]
+        self._event_sources = [entry[2] for entry in entries]
+        self._events = [entry[3] for entry in entries]
+
+    def _add_executions(self, entries: list) -> None:
+        executions = []
+        for entry in entries:
+            source = entry[2]
+            for execution in entry[3].get_execution_events():
+                executions.append((execution, source))
+        if not executions:
+            return
+
+        # Execution offsets may move executions before existing ones. The
+        # existing part is sorted already, which the sort makes use of.
+        executions = (list(zip(self._executions, self._execution_sources)) +
+                      executions)
+        with stats.measure("sort"):
+            executions.sort(key=lambda entry: entry[0].time)
+        self._executions = [entry[0] for entry in executions]
+        self._execution_sources = [entry[1] for entry in executions]
+        self._execution_times = [e.time for e in self._executions]
+
+    def build(self, sources: list, start: datetime, end: datetime) -> None:
+        # start and end should be at full minutes, like all event times
+        self._set_sources(sources)
+        self._start = start
+        self._end = end
+        self._executions = []
+        self._execution_times = []
+        self._execution_sources = []
+
+        self._reset_stream(start)
+        entries = self._take_entries(end)
+        self._set_event_entries(entries)
+        self._add_executions(entries)
+
+    def update(self, sources: list) -> bool:
+        # Patch the index after a config reload. Occurrences of events that
+        # are still part of the config are kept, only new events are
+        # expanded. Returns whether anything changed.
+        old_ids = [id(s) for s in self._sources]
+        if old_ids == [id(s) for s in sources]:
+            return False
+
+        self._set_sources(sources)
+        positions = self._positions
+        old_ids = set(old_ids)
+        added = [s for s in self._sources if id(s) not in old_ids]
+
+        entries = [(time, positions[id(source)], source, event)
+                   for time, source, event in zip(self._event_times,
+                                                  self._event_sources,
+                                                  self._events)
+                   if id(source) in positions]
+        with stats.measure("expansion"):
+            new_entries = list(takewhile(
+                    lambda entry: entry[0] < self._end,
+                    self._merge_entries(added, self._start)))
+        stats.count("occurrences", len(new_entries))
+        # positions of kept events may have changed, but not their order
+        with stats.measure("sort"):
+            entries.sort(key=_entry_key)
+            self._set_event_entries(list(heapq.merge(entries, new_entries,
+                                                     key=_entry_key)))
+        self._reset_stream(self._end)
+
+        kept = [i for i, source in enumerate(self._execution_sources)
+                if id(source) in positions]
+        self._executions = [self._executions[i] for i in kept]
+        self._execution_sources = [self._execution_sources[i] for i in kept]
+        self._execution_times = [self._execution_times[i] for i in kept]
+        self._add_executions(new_entries)
+        return True
+
+    def extend(self, end: datetime) -> None:
+        if end <= self._end:
+            return
+        entries = self._take_entries(end)
+        self._events.extend(entry[3] for entry in entries)
+        self._event_times.extend(entry[0] for entry in entries)
+        self._event_sources.extend(entry[2] for entry in entries)
+        self._add_executions(entries)
+        self._end = end
+
+    def advance(self, start: datetime, end: datetime) -> None:
+        if end < self._end:
+            # only happens when the previewed time span gets shorter
+            self.build(self._sources, start, end)
+            return
+
+        i = bisect_left(self._event_times, start)
+        del self._events[:i]
+        del self._event_times[:i]
+        del self._event_sources[:i]
+
+        i = bisect_left(self._execution_times, start)
+        del self._executions[:i]
+        del self._execution_times[:i]
+        del self._execution_sources[:i]
+
+        self._start = start
+        self.extend(end)
+
+    def events_between(self, start: datetime, end: datetime,
+                       positions: dict = None) -> List[SimpleEvent]:
+        # If positions ({id(source): position}) is given, only occurrences
+        # of these events are returned, sorted by time and these positions.
+        # This way one index can serve several configs sharing events.
+        i = bisect_left(self._event_times, start)
+        j = bisect_left(self._event_times, end, lo=i)
+        if positions is None:
+            return self._events[i:j]
+
+        entries = [(time, positions[id(source)], event)
+                   for time, source, event in zip(self._event_times[i:j],
+                                                  self._event_sources[i:j],
+                                                  self._events[i:j])
+                   if id(source) in positions]
+        entries.sort(key=_entry_key)
+        return [entry[2] for entry in entries]
+
+    def executions_after(self, start: datetime) -> List[ExecutionEvent]:
+        i = bisect_left(self._execution_times, start)
+        return self._executions[i:]
+
+
+class FootnoteIndex:
+    # Footnotes by the day they are shown on: yearly ones by (month, day),
+    # the others by (year, month, day). Built once per config load, then
+    # finding the footnotes of a day takes two lookups, however many
+    # footnotes there are.
+    def __init__(self):
+        self._yearly = {}           # (month, day): [(position, footnote)]
+        self._exact = {}            # (year, month, day): same
+
+    def build(self, footnotes: List[FootnoteEvent]) -> None:
+        # footnotes in the order of the config, which is kept
+        self._yearly = {}
+        self._exact = {}
+        for position, footnote in enumerate(footnotes):
+            yearly = "yearly" in footnote.modifiers
+            for d in footnote.get_footnote_dates():
+                if yearly:
+                    bucket = self._yearly.setdefault((d.month, d.day), [])
+                else:
+                    bucket = self._exact.setdefault(
+                        (d.year, d.month, d.day), [])
+                # a footnote is listed once per day
+                if not bucket or bucket[-1][1] is not footnote:
+                    bucket.append((position, footnote))
+
+    def footnotes_on(self, day: date) -> List[FootnoteEvent]:
+        yearly = self._yearly.get((day.month, day.day), [])
+        exact = self._exact.get((day.year, day.month, day.day), [])
+        if yearly and exact:
+            entries = sorted(dict(yearly + exact).items())
+        else:
+            entries = yearly or exact
+        return [footnote for _, footnote in entries]
+
+    def footnotes_between(self, start: date,
+                          end: date) -> Dict[date, List[FootnoteEvent]]:
+        # The footnotes of every day from start until before end, e.g. of
+        # the previewed days
+        return {start + timedelta(days=i):
+                self.footnotes_on(start + timedelta(days=i))
+                for i in range((end - start).days)}
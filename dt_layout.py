@@ -0,0 +1,383 @@
+#!/usr/bin/python3
+
+# Display independent part of the renderers: Selects the events to show at a
+# given time and turns them into rows. The rendering backends subclass
+# TableLayout.
+
+from dt_event import Event, SimpleEvent
+import dt_settings
+from dt_stats import stats
+from typing import List
+from collections import namedtuple
+from bisect import bisect_left, bisect_right
+import datetime
+import sys
+import threading
+
+# Kinds of rows
+ROW_HEAD = "head"
+ROW_HEAD_CLOCK = "headclock"
+ROW_EVENT = "event"
+ROW_PADDING = "padding"
+ROW_FOOT = "foot"
+
+# Styles of rows
+STYLE_NORMAL = "normal"
+STYLE_PAST = "past"
+STYLE_HILIGHT = "hilight"
+
+# One line of the table as it should be displayed. cells contains the texts
+# of the line: For event lines (until text or tomorrow text, time,
+# description), where None stands for the arrow image, otherwise only one
+# text.
+Row = namedtuple("Row", "kind style cells")
+
+
+def format_row(row: Row) -> str:
+    if row.kind == ROW_PADDING:
+        return ""
+    cells = ["->" if cell is None else cell for cell in row.cells]
+    return "[{}] {}".format(row.style, "".join(cells))
+
+
+class TableLayout():
+    def __init__(self):
+        # todo: Lock for all these settings?
+        self.count_today = 5
+        self.count_tomorrow = 2
+        self.count_past = 999
+        self.tomorrow_before_event = False
+        self.hilight_after = 10                   # minutes
+        self.show_clock = True
+        self.hide_until_when_done = False
+        self.pad_head = False
+        self.pad_foot = False
+
+        self.font = {'name': "Arial", 'size': 30, 'bold': False,
+                     'italics': False, 'underlined': False, 'paddingsize': 30}
+
+        self.texts = {'head': "", 'tomorrow': "$date$",
+                      'today': "$date$", 'until': "until"}
+        self.colors = {'fg': "black", 'bg': "white", 'hfg': "yellow",
+                       'hbg': "blue", 'pbg': "black", 'pfg': "grey"}
+
+        self.footnotes = []                       # str
+        self.footnote_lock = threading.Lock()
+
+        self.events = []                          # SimpleEvent, sorted
+        self._event_times = []                    # times of events
+        self.event_lock = threading.Lock()        # guards both, see set_events
+
+        self._arrow = None                        # arrow image, if loaded
+
+    def load_arrow_image(self, path) -> None:
+        self._arrow = path
+
+    def apply_general(self, general: dict) -> None:
+        # general: (variable, value) pairs of the general section
+        if 'head' in general:
+            self.texts['head'] = general['head']
+        if 'tomorrow' in general:
+            self.texts['tomorrow'] = general['tomorrow']
+        if 'today' in general:
+            self.texts['today'] = general['today']
+        if 'pastcount' in general:
+            self.count_past = int(general['pastcount'])
+
+        if 'untiltext' in general:
+            self.texts['untiltext'] = general['untiltext']
+
+        if 'todaycount' in general:
+            self.count_today = int(general['todaycount'])
+        if 'tomorrowcount' in general:
+            self.count_tomorrow = int(general['tomorrowcount'])
+        if 'tomorrowbeforeevent' in general:
+            self.tomorrow_before_event = bool(
+                int(general['tomorrowbeforeevent']))
+        if 'hilightafter' in general:
+            self.hilight_after = int(general['hilightafter'])
+        if 'showclock' in general:
+            self.show_clock = bool(int(general['showclock']))
+        if 'hideuntilwhendone' in general:
+            self.hide_until_when_done = bool(
+                int(general['hideuntilwhendone']))
+        if 'padhead' in general:
+            self.pad_head = bool(int(general['padhead']))
+        if 'padfoot' in general:
+            self.pad_foot = bool(int(general['padfoot']))
+
+        if 'font' in general:
+            self.font['name'] = general['font']
+        if 'fontsize' in general:
+            self.font['size'] = int(general['fontsize'])
+        if 'fontbold' in general:
+            self.font['bold'] = int(general['fontbold'])
+        if 'fontitalics' in general:
+            self.font['italics'] = bool(int(general['fontitalics']))
+        if 'fontunderlined' in general:
+            self.font['underlined'] = bool(int(general['fontunderlined']))
+        if 'paddingsize' in general:
+            self.font['paddingsize'] = int(general['paddingsize'])
+
+        if 'bg' in general:
+            self.colors['bg'] = general['bg']
+        if 'fg' in general:
+            self.colors['fg'] = general['fg']
+        if 'hbg' in general:
+            self.colors['hbg'] = general['hbg']
+        if 'hfg' in general:
+            self.colors['hfg'] = general['hfg']
+        if 'pbg' in general:
+            self.colors['pbg'] = general['pbg']
+        if 'pfg' in general:
+            self.colors['pfg'] = general['pfg']
+
+        if 'arrow' in general:
+            self.load_arrow_image(general['arrow'])
+
+    def set_events(self, events: List[SimpleEvent]) -> None:
+        # events have to be sorted by time
+        with self.event_lock:
+            self.events = events
+            self._event_times = [e.time for e in events]
+
+    def _remove_past_events(self, events: List[SimpleEvent],
+                            past_count: int) -> List[SimpleEvent]:
+        # events are today's events, the first past_count of them are in the
+        # past. Removes past events, oldest first, beyond count_past as long
+        # as more than count_today events are left today. Events with the
+        # noremove modifier are kept.
+        left_today = len(events)
+        kept = []
+        removed = 0
+        for i in range(past_count):
+            if (past_count <= self.count_past or
+                    left_today - removed <= self.count_today):
+                kept += events[i:]
+                return kept
+            event = events[i]
+            if event.flags & Event.FLAG_NOREMOVE:
+                kept.append(event)
+            else:
+                removed += 1
+                past_count -= 1
+        return kept + events[past_count + removed:]
+
+    def _prepare_today_text(self, now: datetime.datetime) -> str:
+        date = now.date()
+        datestr = dt_settings.dateformat.format(d=date)
+        return self.texts['today'].replace("$date$", datestr)
+
+    def _prepare_tomorrow_text(self, now: datetime.datetime) -> str:
+        date = now.date() + datetime.timedelta(days=1)
+        datestr = dt_settings.dateformat.format(d=date)
+        return self.texts['tomorrow'].replace("$date$", datestr)
+
+    def select_events(self, now: datetime.datetime) -> tuple:
+        # Returns today's events, tomorrow's events and the index of the
+        # event to hilight in today's events (or None). Only the events of
+        # today and tomorrow are looked at, found by bisecting the event
+        # times, so the cost does not depend on how many days are previewed.
+        today_morning = now.replace(hour=0, minute=0)
+        today_limit = now.replace(hour=23, minute=59, second=59)
+        tomorrow_limit = today_limit + datetime.timedelta(days=1)
+        hilight_limit = now - datetime.timedelta(minutes=self.hilight_after)
+
+        with self.footnote_lock:
+            today_count_limit = self.count_today - (len(self.footnotes) - 1)
+
+        with self.event_lock:
+            events = self.events
+            times = self._event_times
+
+            today_events = [events[i] for i in range(
+                                bisect_left(times, today_morning),
+                                bisect_left(times, today_limit))
+                            if not events[i].flags & Event.FLAG_NODRAW]
+
+            tomorrow_events = []
+            for i in range(bisect_right(times, today_limit),
+                           bisect_left(times, tomorrow_limit)):
+                if len(tomorrow_events) >= self.count_tomorrow:
+                    break
+                event = events[i]
+                if (event.flags & Event.FLAG_TOMORROW and
+                        not event.flags & Event.FLAG_NODRAW):
+                    tomorrow_events.append(event)
+
+        today_times = [e.time for e in today_events]
+        past_count = bisect_left(today_times, hilight_limit)
+        today_events = self._remove_past_events(today_events, past_count)
+        today_events = today_events[:max(today_count_limit, 0)]
+
+        hilight_index = None
+        today_times = [e.time for e in today_events]
+        for i in range(bisect_right(today_times, hilight_limit),
+                       len(today_events)):
+            if not today_events[i].flags & Event.FLAG_PADDING:
+                hilight_index = i
+                break
+
+        return today_events, tomorrow_events, hilight_index
+
+    def _get_event_row(self, event: SimpleEvent, style: str, until=True,
+                       prefix: str = None) -> Row:
+        condition_until = event.flags & Event.FLAG_UNTIL and until
+        if prefix is None:
+            prefix = self.texts['untiltext'] + " " if condition_until else ""
+
+        condition_time = not event.flags & Event.FLAG_NOTIME
+        time = event.timestring() + " " if condition_time else ""
+        return Row(ROW_EVENT, style, (prefix, time, event.description))
+
+    def _get_hilight_event_row(self, event: SimpleEvent) -> Row:
+        if not event.flags & Event.FLAG_UNTIL and self._arrow is not None:
+            prefix = None
+        else:
+            condition_until = event.flags & Event.FLAG_UNTIL
+            prefix = self.texts['untiltext'] + " " if condition_until else ""
+
+        condition_time = not event.flags & Event.FLAG_NOTIME
+        time = event.timestring() + " " if condition_time else ""
+        return Row(ROW_EVENT, STYLE_HILIGHT, (prefix, time, event.description))
+
+    def _build_rows(self,
+                    today_events: List[SimpleEvent],
+                    tomorrow_events: List[SimpleEvent],
+                    hilight_event: SimpleEvent,  # or None
+                    current_time: datetime.datetime) -> List[Row]:
+        padding_row = Row(ROW_PADDING, STYLE_NORMAL, ("A",))
+        event_drawn = False
+        rows = []
+
+        if len(self.texts['head']) != 0:
+            rows.append(Row(ROW_HEAD, STYLE_NORMAL, (self.texts['head'],)))
+            if self.pad_head:
+                rows.append(padding_row)
+
+        if (len(self.texts['today']) != 0 and len(today_events) > 0 or
+                self.show_clock):
+            event_drawn = True
+            kind = ROW_HEAD_CLOCK if self.show_clock else ROW_HEAD
+            text = self._prepare_today_text(current_time)
+            rows.append(Row(kind, STYLE_NORMAL, (text,)))
+
+        for event in today_events:
+            event_drawn = True
+            if event.flags & Event.FLAG_PADDING:
+                rows.append(padding_row)
+            elif event == hilight_event:
+                rows.append(self._get_hilight_event_row(event))
+            elif event.time < current_time:
+                rows.append(self._get_event_row(event, STYLE_PAST, False))
+            else:
+                rows.append(self._get_event_row(event, STYLE_NORMAL))
+
+        tomorrow_text = self._prepare_tomorrow_text(current_time)
+        if len(self.texts['tomorrow']) != 0 and len(tomorrow_events) > 0:
+            if event_drawn:
+                rows.append(padding_row)
+            if not self.tomorrow_before_event:
+                rows.append(Row(ROW_HEAD, STYLE_NORMAL, (tomorrow_text,)))
+
+        first = True
+        for event in tomorrow_events:
+            if event.flags & Event.FLAG_PADDING:
+                rows.append(padding_row)
+            elif first and self.tomorrow_before_event:
+                rows.append(self._get_event_row(event, STYLE_NORMAL,
+                                                until=False,
+                                                prefix=tomorrow_text + " "))
+            else:
+                rows.append(self._get_event_row(event, STYLE_NORMAL))
+
+        with self.footnote_lock:
+            if self.footnotes and self.pad_foot:
+                rows.append(padding_row)
+
+            for note in self.footnotes:
+                rows.append(Row(ROW_FOOT, STYLE_NORMAL, (note,)))
+
+        return rows
+
+    def layout(self, now: datetime.datetime) -> tuple:
+        # Returns the rows to display at the given time and the time when
+        # they have to be laid out again, see _get_next_change.
+        with stats.measure("selection"):
+            selection = self.select_events(now)
+        today_events, tomorrow_events, hilight_index = selection
+        hilight_event = None
+        if hilight_index is not None:
+            hilight_event = today_events[hilight_index]
+        rows = self._build_rows(today_events, tomorrow_events, hilight_event,
+                                now)
+
+        return rows, self._get_next_change(now)
+
+    def _get_next_change(self, now: datetime.datetime) -> datetime.datetime:
+        # The next time an event starts or its hilight time ends, or
+        # midnight. Events that are not shown count as well, they decide
+        # which ones are shown. Depending on the comparison, rows change at
+        # or right after these times.
+        hilight_time = datetime.timedelta(minutes=self.hilight_after)
+        with self.event_lock:
+            times = self._event_times
+            i = bisect_left(times, now)
+            j = bisect_left(times, now - hilight_time)
+            ends = [times[i]] if i < len(times) else []
+            if j < len(times):
+                ends.append(times[j] + hilight_time)
+
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        midnight = midnight + datetime.timedelta(days=1)
+        after = datetime.timedelta(microseconds=1)
+        return min([c for t in ends for c in (t, t + after) if now < c] +
+                   [midnight])
+
+
+class HeadlessRenderer(TableLayout):
+    # Renderer without a display. Keeps the current rows in self.rows and
+    # writes them to output whenever they change.
+    def __init__(self, output=sys.stdout):
+        TableLayout.__init__(self)
+        self.rows = []
+        self._output = output
+        self._condition = threading.Condition()
+        self._changed = True
+        self._stopped = False
+
+    def render(self, now: datetime.datetime = None) -> datetime.datetime:
+        # Returns the time of the next necessary render
+        rows, next_render = self.layout(now or datetime.datetime.now())
+        if rows != self.rows:
+            self.rows = rows
+            for row in rows:
+                self._output.write(format_row(row) + "\n")
+            self._output.write("\n")
+            self._output.flush()
+        return next_render
+
+    def events_changed(self) -> None:
+        with self._condition:
+            self._changed = True
+            self._condition.notify()
+
+    def quit(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def mainloop(self) -> None:
+        next_render = None
+        while True:
+            with self._condition:
+                while not self._stopped and not self._changed:
+                    wait = (next_render -
+                            datetime.datetime.now()).total_seconds()
+                    if wait <= 0:
+                        break
+                    self._condition.wait(wait)
+                if self._stopped:
+                    return
+                self._changed = False
+            next_render = self.render()
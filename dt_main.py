@@ -1,250 +1,278 @@
 #!/usr/bin/python3
 
-from dt_config import ConfigReader, ConfigCleaner
+from dt_config import ConfigCleaner, CleanThread, get_footnotes
+from dt_config import get_preview_days
 import dt_settings
 from dt_renderer import TableRenderer
+from dt_layout import HeadlessRenderer
+from dt_web import WebRenderer
 from dt_execute import ExecutionManager
+from dt_index import OccurrenceIndex, FootnoteIndex
+from dt_index import get_preview_timespan, get_seconds_until_tomorrow
+from dt_stats import stats, log
+from dt_watch import ConfigChangeHandler
 
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler, FileModifiedEvent
 
 import sys
+import cProfile
 import traceback
 import threading
 import datetime
+import time
 import locale
 import argparse
 from os import path
-from time import sleep
-from shutil import copyfile
-
-
-class ConfigChangeHandler(FileSystemEventHandler):
-    def __init__(self, filename, event_to_set):
-        FileSystemEventHandler.__init__(self)
-        self._filename = filename
-        self._event = event_to_set
-
-    def on_modified(self, event: FileModifiedEvent) -> None:
-        if event.is_directory:
-            return
-        if path.abspath(self._filename) == path.abspath(event.src_path):
-            self._event.set()
 
 
 class Timetable():
-    def __init__(self, fullscreen):
-        self._log("Timetable started.")
+    def __init__(self, fullscreen, headless=False, debug=False,
+                 profile_path=None, web_port=None):
+        self._debug = debug                  # log every event on updates
+        self._profile_path = profile_path    # profile of the update thread
+        log("Timetable started.")
         if fullscreen:
-            self._log("Starting in fullscreen mode.")
+            log("Starting in fullscreen mode.")
 
         self._config_path = path.abspath(dt_settings.filename)
         if not path.isfile(self._config_path):
             raise Exception("Wrong config file given: " + dt_settings.filename)
 
-        self._config_change_event = threading.Event()
-        self._config_change_event.set()      # trigger loading the config file
+        # The update thread sleeps until one of these is set or the date
+        # changes. All of them are guarded by _wakeup.
+        self._wakeup = threading.Condition()
+        self._config_changed = True          # trigger loading the config file
+        self._update_requested = False
+        self._stopping = False
+        self._next_stats_log = (time.monotonic() +
+                                dt_settings.stats_log_interval_s)
 
-        self._renderer_preview_timespan = 5  # days
-        self._update_event = threading.Event()
+        self._renderer_preview_timespan = get_preview_days({})
 
-        self._log("Starting file monitor thread...")
+        log("Starting file monitor thread...")
         handler = ConfigChangeHandler(
                 dt_settings.filename,
-                self._config_change_event
+                self._notify_config_change,
+                dt_settings.filewatch_quiet_period_s
                 )
         self._observer = Observer()
         self._observer.schedule(handler, path.dirname(self._config_path))
         self._observer.start()
 
-        self._reader = ConfigReader()
-        self._cleaner = ConfigCleaner()
+        # The reader also cleans the config file, in its own thread
+        self._reader = ConfigCleaner(dt_settings.cachesuffix)
+        self._reader_lock = threading.Lock()
+        self._clean_thread = CleanThread(self._reader, self._reader_lock,
+                                         log)
+        self._config = self._reader.snapshot()  # replaced on every reload
+        self._index = OccurrenceIndex()
+        self._index.build([], *self._get_preview_timespan())
+        self._footnote_index = FootnoteIndex()
         self._cleaned_date = datetime.date.today()
 
-        self._renderer = TableRenderer(fullscreen)
+        if web_port is not None:
+            self._renderer = WebRenderer(dt_settings.webhost, web_port)
+            log("Rendering to web browsers on port {}.".format(
+                self._renderer.port))
+        elif headless:
+            log("Rendering without a display.")
+            self._renderer = HeadlessRenderer()
+        else:
+            self._renderer = TableRenderer(fullscreen)
         # renderer will be filled when config is reloaded
 
-        self._execution_manager = ExecutionManager()
+        self._execution_manager = ExecutionManager(log)
 
         self._update_thread = threading.Thread(target=self.update_loop)
-        self._stop_update_thread = threading.Event()
-
-    def _log(self, s: str) -> None:
-        print(datetime.datetime.now().strftime("[%d.%m %H:%M:%S] ") + s)
 
     def _apply_general_section(self) -> None:
-        renderer = self._renderer
-        general = self._reader.general  # dict of (variable, value) pairs
-
-        if 'head' in general:
-            renderer.texts['head'] = general['head']
-        if 'tomorrow' in general:
-            renderer.texts['tomorrow'] = general['tomorrow']
-        if 'today' in general:
-            renderer.texts['today'] = general['today']
-        if 'pastcount' in general:
-            renderer.count_past = int(general['pastcount'])
-
-        if 'untiltext' in general:
-            renderer.texts['untiltext'] = general['untiltext']
-
-        if 'todaycount' in general:
-            renderer.count_today = int(general['todaycount'])
-        if 'tomorrowcount' in general:
-            renderer.count_tomorrow = int(general['tomorrowcount'])
-        if 'tomorrowbeforeevent' in general:
-            renderer.tomorrow_before_event = bool(
-                int(general['tomorrowbeforeevent']))
-        if 'hilightafter' in general:
-            renderer.hilight_after = int(general['hilightafter'])
-        if 'showclock' in general:
-            renderer.show_clock = bool(int(general['showclock']))
-        if 'hideuntilwhendone' in general:
-            renderer.hide_until_when_done = bool(
-                int(general['hideuntilwhendone']))
-        if 'padhead' in general:
-            renderer.pad_head = bool(int(general['padhead']))
-        if 'padfoot' in general:
-            renderer.pad_foot = bool(int(general['padfoot']))
-
-        if 'font' in general:
-            renderer.font['name'] = general['font']
-        if 'fontsize' in general:
-            renderer.font['size'] = int(general['fontsize'])
-        if 'fontbold' in general:
-            renderer.font['bold'] = int(general['fontbold'])
-        if 'fontitalics' in general:
-            renderer.font['italics'] = bool(int(general['fontitalics']))
-        if 'fontunderlined' in general:
-            renderer.font['underlined'] = bool(int(general['fontunderlined']))
-        if 'paddingsize' in general:
-            renderer.font['paddingsize'] = int(general['paddingsize'])
-
-        if 'bg' in general:
-            renderer.colors['bg'] = general['bg']
-        if 'fg' in general:
-            renderer.colors['fg'] = general['fg']
-        if 'hbg' in general:
-            renderer.colors['hbg'] = general['hbg']
-        if 'hfg' in general:
-            renderer.colors['hfg'] = general['hfg']
-        if 'pbg' in general:
-            renderer.colors['pbg'] = general['pbg']
-        if 'pfg' in general:
-            renderer.colors['pfg'] = general['pfg']
-
-        if 'arrow' in general:
-            renderer.load_arrow_image(general['arrow'])
+        general = self._config.general
+        self._renderer.apply_general(general)
+        self._renderer_preview_timespan = get_preview_days(general)
 
     def _handle_config_change(self) -> None:
-        new = ConfigReader()
-        self._log("Config change detected. Reparsing...")
+        # The reader only parses the events that changed since the last time.
+        # The new config is swapped in as a whole once parsing succeeded.
+        log("Config change detected. Reparsing...")
         try:
-            new.parse(self._config_path, dt_settings.fileencoding)
+            with self._reader_lock, stats.measure("parse"):
+                config = self._reader.parse(self._config_path,
+                                            dt_settings.fileencoding)
         except Exception:
-            self._log("!!! Error: Could not parse config file.")
+            log("!!! Error: Could not parse config file.")
             traceback.print_exc()
             return
 
-        self._log("Applying changes...")
-        self._reader.parse(self._config_path, dt_settings.fileencoding)
+        if config == self._config:
+            # e.g. after the file was cleaned
+            log("Config did not change.")
+            return
+
+        log("Applying changes...")
+        self._config = config
         self._apply_general_section()
-        self._update_event.set()
+        with stats.measure("index"):
+            if self._index.update(config.recurring + config.unique):
+                log("Events changed. Occurrence index updated.")
+            # previewdays may have changed
+            self._index.advance(*self._get_preview_timespan())
+            self._footnote_index.build(config.footnotes)
+        self._request_update()
+
+    def _get_preview_timespan(self) -> tuple:
+        return get_preview_timespan(self._renderer_preview_timespan)
 
     def _update_renderer_and_execution_manager(self) -> None:
-        self._log("Updating Renderer and Execution Manager...")
-        events = []
-        execution_events = []
-        t1 = datetime.datetime.now().replace(hour=0, minute=0, second=0)
-        t2 = t1 + datetime.timedelta(days=self._renderer_preview_timespan)
-        for recurring_event in self._reader.recurring:
-            events = events + recurring_event.get_next_simpleevents(t1, t2)
-        for unique_event in self._reader.unique:
-            events = events + unique_event.get_next_simpleevents(t1, t2)
-
-        today = datetime.date.today()
-        footnotes = [e.description for e in self._reader.footnotes
-                     if e.matches(today)]
-        if not footnotes and "foot" in self._reader.general:
-            footnotes = [self._reader.general["foot"]]
-
-        self._log("-------------------------------")
-        self._log("Next Events:")
-        for event in events:
-            self._log("At [" + str(event.time) + "]: " + event.description)
-            execution_events += event.get_execution_events()
-
-        self._log("-------------------------------")
-        self._log("Next Executions:")
-        for event in execution_events:
-            self._log("At [" + str(event.time) + "]: " + event.executable)
-        self._log("-------------------------------")
-
-        self._log("-------------------------------")
-        self._log("Current Footnotes:")
-        for note in footnotes:
-            self._log(note)
-        self._log("-------------------------------")
-
-        with self._renderer.event_lock:
-            self._renderer.events = events
+        log("Updating Renderer and Execution Manager...")
+        t1, t2 = self._get_preview_timespan()
+        events = self._index.events_between(t1, t2)
+        execution_events = self._index.executions_after(
+                datetime.datetime.now())
+
+        footnotes = get_footnotes(self._config, self._footnote_index,
+                                  datetime.date.today())
+
+        log("{} events, {} executions, {} footnotes.".format(
+                len(events), len(execution_events), len(footnotes)))
+
+        if self._debug:
+            log("-------------------------------")
+            log("Next Events:")
+            for event in events:
+                log("At [" + str(event.time) + "]: " +
+                    event.description)
+
+            log("-------------------------------")
+            log("Next Executions:")
+            for event in execution_events:
+                log("At [" + str(event.time) + "]: " +
+                    event.executable)
+            log("-------------------------------")
+
+            log("-------------------------------")
+            log("Current Footnotes:")
+            for note in footnotes:
+                log(note)
+            log("-------------------------------")
+
+        self._renderer.set_events(events)
 
         with self._renderer.footnote_lock:
             self._renderer.footnotes = footnotes
 
         self._renderer.events_changed()
 
-        with self._execution_manager.event_lock:
-            self._execution_manager.events = execution_events
-            self._execution_manager.events_changed.set()
+        self._execution_manager.set_events(execution_events)
 
     def mainloop(self) -> None:
+        self._execution_manager.start()
         self._update_thread.start()
         try:
             self._renderer.mainloop()
         except KeyboardInterrupt:
             pass
 
-        self._stop_update_thread.set()
+        self._stop_update_loop()
 
         # todo: sometimes deadlock, not ending the thread shouldn't cause
         # a problem though
-        # self._log("Waiting for the file monitor thread to finish...")
+        # log("Waiting for the file monitor thread to finish...")
         # self._observer.stop()
         # self._observer.join()
-        self._log("Waiting for the update thread to finish...")
+        log("Waiting for the update thread to finish...")
         self._update_thread.join()
+        log("Waiting for the execution thread to finish...")
+        self._execution_manager.stop()
+        log("Stats: " + stats.summary())
+
+    def _notify_config_change(self) -> None:
+        with self._wakeup:
+            self._config_changed = True
+            self._wakeup.notify()
+
+    def _request_update(self) -> None:
+        with self._wakeup:
+            self._update_requested = True
+            self._wakeup.notify()
+
+    def _stop_update_loop(self) -> None:
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+
+    def _log_stats_if_due(self) -> float:
+        # Returns the seconds until the next stats summary is due
+        now = time.monotonic()
+        if now >= self._next_stats_log:
+            log("Stats: " + stats.summary())
+            self._next_stats_log = now + dt_settings.stats_log_interval_s
+        return self._next_stats_log - now
+
+    def _wait_for_work(self) -> tuple:
+        # Returns which of config change, update and date change to handle,
+        # or None to stop.
+        with self._wakeup:
+            while True:
+                if self._stopping:
+                    return None
+                date_changed = datetime.date.today() > self._cleaned_date
+                if (self._config_changed or self._update_requested or
+                        date_changed):
+                    break
+                # Waiting uses a monotonic clock, so wake up now and then to
+                # notice changes of the system time.
+                self._wakeup.wait(min(get_seconds_until_tomorrow(),
+                                      self._log_stats_if_due(),
+                                      dt_settings.updatethread_max_wait_s))
+
+            work = (self._config_changed, self._update_requested,
+                    date_changed)
+            self._config_changed = False
+            self._update_requested = False
+            return work
 
     def update_loop(self) -> None:
-        while not self._stop_update_thread.isSet():
-            if self._config_change_event.isSet():
+        if self._profile_path is None:
+            self._update_loop()
+            return
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            self._update_loop()
+        finally:
+            profile.disable()
+            profile.dump_stats(self._profile_path + ".update")
+
+    def _update_loop(self) -> None:
+        while True:
+            work = self._wait_for_work()
+            if work is None:
+                return
+            config_changed, update_requested, date_changed = work
+
+            if config_changed:
                 self._handle_config_change()
-                self._config_change_event.clear()
-
-            if self._update_event.isSet():
-                self._update_renderer_and_execution_manager()
-                self._update_event.clear()
-
-            try:
-                self._execution_manager.tick()
-            except OSError as e:
-                self._log("Couldn't execute: " + str(e))
-
-            if datetime.date.today() > self._cleaned_date:
-                self._log("Date change detected. Cleaning...")
-                copyfile(self._config_path, self._config_path + ".bak")
-                try:
-                    self._cleaner.clean(self._config_path,
-                                        dt_settings.fileencoding)
-                except Exception:
-                    self._log("!!! Cleaning the config file failed. Error:")
-                    traceback.print_exc()
-
-                # trigger updating the renderer:
-                self._update_event.set()
+
+            if date_changed:
+                log("Date change detected.")
+                # reloaded once the file is cleaned
+                self._clean_thread.start(self._config_path,
+                                         dt_settings.fileencoding,
+                                         self._notify_config_change)
+
+                # move the index forward and update the renderer:
+                with stats.measure("index"):
+                    self._index.advance(*self._get_preview_timespan())
                 self._cleaned_date = datetime.date.today()
+                update_requested = True
 
-            sleep(dt_settings.updatethread_sleeptime_s)
+            if update_requested:
+                # also covers the update requested by the config change
+                with self._wakeup:
+                    self._update_requested = False
+                with stats.measure("update"):
+                    self._update_renderer_and_execution_manager()
 
 
 # from freezegun import freeze_time
@@ -255,6 +283,17 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--fullscreen",
                         help="start in fullscreen mode", action="store_true")
+    parser.add_argument("--headless", action="store_true",
+                        help="print the table to the console instead of "
+                             "opening a window")
+    parser.add_argument("--web", type=int, metavar="PORT",
+                        help="show the table in web browsers connecting to "
+                             "PORT instead of opening a window")
+    parser.add_argument("--debug", action="store_true",
+                        help="log all events on every update")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="write cProfile stats of the main thread to "
+                             "FILE and of the update thread to FILE.update")
     args = parser.parse_args()
 
     # defensive loop to restart if error occurs
@@ -264,8 +303,14 @@ def main():
 
     while not exited_gracefully:
         try:
-            table = Timetable(args.fullscreen)
-            table.mainloop()
+            table = Timetable(args.fullscreen, args.headless, args.debug,
+                              args.profile, args.web)
+            if args.profile is None:
+                table.mainloop()
+            else:
+                profile = cProfile.Profile()
+                profile.runcall(table.mainloop)
+                profile.dump_stats(args.profile)
             exited_gracefully = True
         except Exception:
             traceback.print_exc()
@@ -1,13 +1,85 @@
 #!/usr/bin/python3
-from dt_event import SimpleEvent
+from dt_layout import TableLayout, Row
+from dt_layout import ROW_HEAD, ROW_HEAD_CLOCK, ROW_EVENT, ROW_FOOT
+from dt_layout import ROW_PADDING
+from dt_layout import STYLE_NORMAL, STYLE_PAST, STYLE_HILIGHT
 import dt_settings
+from dt_stats import stats
 from typing import List
 import tkinter
-import threading
+import tkinter.font
 import datetime
+import math
+import signal
+import socket
+from collections import namedtuple
+
+# Keys into TableRenderer.colors (background, foreground) for every style
+_style_colors = {STYLE_NORMAL: ('bg', 'fg'),
+                 STYLE_PAST: ('pbg', 'pfg'),
+                 STYLE_HILIGHT: ('hbg', 'hfg')}
+
+# Labels currently displaying a row, with the options last applied to them
+_Line = namedtuple("_Line", "row labels options")
+
+# Keys into StyleRegistry.fonts
+FONT_NORMAL = "normal"
+FONT_PADDING = "padding"
+
+# Signals that end the main loop
+_quit_signals = (signal.SIGINT, signal.SIGTERM)
+
+
+def _ignore_signal(signum, frame) -> None:
+    pass  # handled by TableRenderer._signal_received
+
+
+def _get_clock_resolution() -> datetime.timedelta:
+    # A second if the clock format shows seconds, otherwise a minute
+    t = datetime.datetime(2000, 1, 1)
+    if (dt_settings.clockformat.format(dt=t) !=
+            dt_settings.clockformat.format(dt=t.replace(second=1))):
+        return datetime.timedelta(seconds=1)
+    return datetime.timedelta(minutes=1)
+
+
+class StyleRegistry:
+    # Fonts and colors shared by all labels. They are made once and only
+    # changed when the settings change, e.g. on a config reload. Labels
+    # refer to the fonts by name, so changing a font changes all labels at
+    # once.
+
+    def __init__(self, root: tkinter.Tk):
+        self._root = root
+        self.fonts = {}                       # key: tkinter.font.Font
+        self.colors = {}                      # style: (background, fg)
+        self._settings = None                 # (font, colors) applied last
+
+    def update(self, font: dict, colors: dict) -> bool:
+        # font and colors as in TableLayout. Returns whether they changed.
+        settings = (dict(font), dict(colors))
+        if settings == self._settings:
+            return False
+        self._settings = settings
+
+        options = {'family': font['name'],
+                   'weight': "bold" if font['bold'] else "normal",
+                   'slant': "italic" if font['italics'] else "roman",
+                   'underline': bool(font['underlined'])}
+        sizes = {FONT_NORMAL: font['size'], FONT_PADDING: font['paddingsize']}
+        for key, size in sizes.items():
+            if key in self.fonts:
+                self.fonts[key].configure(size=size, **options)
+            else:
+                self.fonts[key] = tkinter.font.Font(self._root, size=size,
+                                                    **options)
+
+        self.colors = {style: (colors[bg], colors[fg])
+                       for style, (bg, fg) in _style_colors.items()}
+        return True
 
 
-class TableRenderer():
+class TableRenderer(TableLayout):
     _col_arrow = 0
     _col_time = 1
     _col_text = 2
@@ -15,36 +87,19 @@ class TableRenderer():
     _col_count = 4
 
     def __init__(self, fullscreen):
-        # todo: Lock for all these settings?
-        self.count_today = 5
-        self.count_tomorrow = 2
-        self.count_past = 999
-        self.tomorrow_before_event = False
-        self.hilight_after = 10                   # minutes
-        self.show_clock = True
-        self.hide_until_when_done = False
-        self.pad_head = False
-        self.pad_foot = False
-
-        self.font = {'name': "Arial", 'size': 30, 'bold': False,
-                     'italics': False, 'underlined': False, 'paddingsize': 30}
-        self._font_string = "Arial 30"
-
-        self.texts = {'head': "", 'tomorrow': "$date$",
-                      'today': "$date$", 'until': "until"}
-        self.colors = {'fg': "black", 'bg': "white", 'hfg': "yellow",
-                       'hbg': "blue", 'pbg': "black", 'pfg': "grey"}
-
-        self.footnotes = []                       # str
-        self.footnote_lock = threading.Lock()
-
-        self.events = []                          # SimpleEvent
-        self.event_lock = threading.Lock()
-
-        self._labels = []
-        # List of lists: [3 x None or tkinter.Label], arrow, time and text
-
-        self._arrow = None                        # Tkinter.PhotoImage
+        TableLayout.__init__(self)
+
+        self._lines = []                          # _Line, one per row
+        self._row_weights = []                    # grid weight of each row
+
+        # A single timer wakes the renderer at the next visible change
+        self._next_change = None                  # to lay out rows again
+        self._timer = None                        # id of the Tk timer
+        self._clock_resolution = _get_clock_resolution()
+
+        self._signal_socket = None                # see _watch_signals
+        self._quit_signal = None                  # signal that ended loop
+
         self._fullscreen_state = False
 
         self._tk = tkinter.Tk()
@@ -54,23 +109,77 @@ class TableRenderer():
         self._tk.bind('q', lambda e: self._tk.quit())
         self._tk.bind('<F11>', self._toggle_fullscreen_event_handler)
         self._tk.bind('<Escape>', lambda e: self._tk.quit())
+        self._tk.grid_columnconfigure(self._col_text, weight=1)
         self._clock_text = tkinter.StringVar()
-        self._update_clock_text()
+        self._styles = StyleRegistry(self._tk)
+        self._update_clock_text(datetime.datetime.now())
 
         if fullscreen:
             self._toggle_fullscreen()
 
-        # in order to detect and raise a keyboard interrupt, tkinter has to be
-        # active -> generate activity:
-        self._dummy_activity()
-
-    def _update_clock_text(self) -> None:
-        text = dt_settings.clockformat.format(dt=datetime.datetime.now())
-        self._clock_text.set(text)
-        self._tk.after(1000, self._update_clock_text)
-
-    def _dummy_activity(self) -> None:
-        self._tk.after(100, self._dummy_activity)
+    def _update_clock_text(self, now: datetime.datetime) -> None:
+        self._clock_text.set(dt_settings.clockformat.format(dt=now))
+
+    def _set_timer(self, now: datetime.datetime) -> None:
+        # Wakes up when the rows change or the clock shows the next minute
+        # or second. The longest wait is limited, the Tk timer does not
+        # notice changes of the system time.
+        when = min(self._next_change, now + datetime.timedelta(
+            seconds=dt_settings.renderer_max_wait_s))
+        if self.show_clock:
+            tick = now.replace(microsecond=0)
+            if self._clock_resolution == datetime.timedelta(minutes=1):
+                tick = tick.replace(second=0)
+            when = min(when, tick + self._clock_resolution)
+
+        delay = math.ceil((when - now).total_seconds() * 1000)
+        if self._timer is not None:
+            self._tk.after_cancel(self._timer)
+        self._timer = self._tk.after(max(delay, 1), self._timer_expired)
+
+    def _timer_expired(self) -> None:
+        self._timer = None
+        now = datetime.datetime.now()
+        if now >= self._next_change:
+            self._handle_new_events()
+        else:
+            self._update_clock_text(now)
+            self._set_timer(now)
+
+    def _watch_signals(self) -> None:
+        # While waiting, Tk does not return to Python, which therefore could
+        # only handle signals at the next Tk event. Instead, signals are
+        # written to a socket that Tk watches. SIGINT and SIGTERM end the
+        # main loop.
+        self._signal_socket, writer = socket.socketpair()
+        self._signal_socket.setblocking(False)
+        writer.setblocking(False)
+        self._signal_writer = writer
+        self._previous_wakeup_fd = signal.set_wakeup_fd(writer.fileno())
+        self._previous_handlers = {
+            signum: signal.signal(signum, _ignore_signal)
+            for signum in _quit_signals}
+        self._tk.createfilehandler(self._signal_socket, tkinter.READABLE,
+                                   self._signal_received)
+
+    def _unwatch_signals(self) -> None:
+        self._tk.deletefilehandler(self._signal_socket)
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        signal.set_wakeup_fd(self._previous_wakeup_fd)
+        self._signal_socket.close()
+        self._signal_writer.close()
+        self._signal_socket = None
+
+    def _signal_received(self, file, mask) -> None:
+        try:
+            signums = self._signal_socket.recv(64)
+        except BlockingIOError:
+            return
+        for signum in signums:
+            if signum in _quit_signals and self._quit_signal is None:
+                self._quit_signal = signum
+                self._tk.quit()
 
     def _delete_window_callback(self) -> None:
         self._tk.quit()
@@ -84,357 +193,136 @@ class TableRenderer():
         cursor = "none" if self._fullscreen_state else "arrow"
         self._tk.config(cursor=cursor)
 
-    def _sort_events(self) -> None:
-        with self.event_lock:
-            self.events = sorted(self.events, key=lambda event: event.time)
-
-    def _remove_past_events(self) -> None:
-        with self.event_lock:
-            now = datetime.datetime.now()
-            now = now - datetime.timedelta(minutes=self.hilight_after)
-            today_morning = datetime.datetime.now().replace(hour=0, minute=0)
-            today_evening = datetime.datetime.now().replace(hour=23, minute=59)
-            self.events[:] = [e for e in self.events
-                              if e.time >= today_morning]
-
-            past_event_count = 0
-            to_remove = []
-            for event in self.events:
-                if event.time < now:
-                    past_event_count += 1
-
-            left_today = [e for e in self.events if e.time <= today_evening]
-            for event in self.events:
-                if past_event_count <= self.count_past:
-                    break
-                if len(left_today) - len(to_remove) <= self.count_today:
-                    break
-                if event.time < now and "noremove" not in event.modifiers:
-                    to_remove.append(event)
-                    past_event_count -= 1
-
-            self.events[:] = [e for e in self.events if e not in to_remove]
-
-    def _remove_nodraw_events(self) -> None:
-        with self.event_lock:
-            for event in self.events:
-                if "nodraw" in event.modifiers:
-                    self.events.remove(event)
-
     def _handle_new_events(self) -> None:
-        self._sort_events()
-        self._remove_past_events()
-        self._remove_nodraw_events()
-
-        today_events, tomorrow_events = self._get_events_to_render()
-        hilight_event = self._find_event_to_hilight(today_events)
-        self._tk.configure(bg=self.colors['bg'])
-
-        self._clear_window()
-        self._fill_window(today_events, tomorrow_events, hilight_event,
-                          datetime.datetime.now())
-
-        if hilight_event is None:
-            t = datetime.datetime.today().replace(hour=0, minute=0, second=0)
-            t = t + datetime.timedelta(days=1)
-        else:
-            t = hilight_event.time
-            t = t + datetime.timedelta(minutes=self.hilight_after)
-
-        self._handle_new_events_set_timer(t)
-
-    def _handle_new_events_set_timer(self, when: datetime.datetime) -> None:
-        timediff = when - datetime.datetime.now()
-        time = timediff.total_seconds() * 1000
-
-        time = 1000 * 10 if time < 0 else time
-        self._tk.after(int(time), self._handle_new_events)
-
-    def _prepare_today_text(self) -> str:
-        date = datetime.date.today()
-        datestr = dt_settings.dateformat.format(d=date)
-        return self.texts['today'].replace("$date$", datestr)
-
-    def _prepare_tomorrow_text(self) -> str:
-        date = datetime.date.today() + datetime.timedelta(days=1)
-        datestr = dt_settings.dateformat.format(d=date)
-        return self.texts['tomorrow'].replace("$date$", datestr)
-
-    def _build_font_string(self) -> None:
-        result = self.font['name'] + " " + str(self.font['size'])
-        if self.font['bold'] is not False:
-            result += " bold"
-        if self.font['italics'] is not False:
-            result += " italic"
-        if self.font['underlined'] is not False:
-            result += " underlined"
-        self._font_string = result
-
-    def _get_normal_label(self, text) -> tkinter.Label:
-        label = tkinter.Label(self._tk, text=text)
-        label.config(bg=self.colors['bg'], fg=self.colors['fg'])
-        label.config(font=self._font_string)
-        return label
-
-    def _get_stringvar_label(self, stringvar) -> tkinter.Label:
-        label = tkinter.Label(self._tk, textvariable=stringvar)
-        label.config(bg=self.colors['bg'], fg=self.colors['fg'])
-        label.config(font=self._font_string)
-        return label
-
-    def _get_padding_label(self) -> tkinter.Label:
-        pad_font = self._font_string.replace(
-            str(self.font['size']), str(self.font['paddingsize']))
-        label = tkinter.Label(self._tk, text="A")
-        label.config(bg=self.colors['bg'], fg=self.colors['bg'])
-        label.config(font=pad_font)
-        return label
-
-    def _get_past_label(self, text) -> tkinter.Label:
-        label = tkinter.Label(self._tk, text=text)
-        label.config(bg=self.colors['pbg'], fg=self.colors['pfg'])
-        label.config(font=self._font_string)
-        return label
-
-    def _get_hilight_label(self, text) -> tkinter.Label:
-        label = tkinter.Label(self._tk, text=text)
-        label.config(bg=self.colors['hbg'], fg=self.colors['hfg'])
-        label.config(font=self._font_string)
-        return label
-
-    def _create_head_line_with_clock(self, text: str, row: int) -> None:
-        label = self._get_normal_label(text)
-        label.configure(anchor=tkinter.W)
-        label.grid(columnspan=self._col_count-self._col_arrow-1,
-                   column=self._col_arrow, row=row, sticky="NSWE")
-        label_clock = self._get_stringvar_label(self._clock_text)
-        label_clock.configure(anchor=tkinter.E)
-        label_clock.grid(column=self._col_clock, row=row, sticky="NSWE")
-        self._labels.append([None, label, None, label_clock])
-
-    def _create_head_line(self, text: str, row: int) -> None:
-        label = self._get_normal_label(text)
-        label.configure(anchor=tkinter.W)
-        label.grid(columnspan=self._col_count, column=self._col_arrow, row=row,
-                   sticky="NSWE")
-        self._labels.append([label, None, None, None])
-
-    def _create_foot_line(self, text: str, row: int) -> None:
-        label = self._get_normal_label(text)
-        label.configure(anchor=tkinter.W)
-        label.grid(columnspan=self._col_count, column=self._col_arrow, row=row,
-                   sticky="SWE")
-        self._labels.append([label, None, None, None])
-
-    def _create_normal_event_line(self, event: SimpleEvent, row: int) -> None:
-        return self._create_event_line(event, row, self._get_normal_label)
-
-    def _create_past_event_line(self, event: SimpleEvent, row: int) -> None:
-        return self._create_event_line(event, row, self._get_past_label, False)
-
-    def _create_event_line(self, event: SimpleEvent, row: int,
-                           get_label_func: callable, until=True,
-                           tomorrow=False) -> None:
-        ls = []
-
-        condition_until = "until" in event.modifiers and until
-        if tomorrow:
-            text = self._prepare_tomorrow_text() + " "
+        now = datetime.datetime.now()
+        rows, self._next_change = self.layout(now)
+        self._update_clock_text(now)
+        if self._styles.update(self.font, self.colors):
+            self._tk.configure(bg=self.colors['bg'])
+
+        with stats.measure("widgets"):
+            self._reconcile_rows(rows)
+        self._set_timer(now)
+
+    def _get_cell_options(self, row: Row, cell: int) -> dict:
+        if row.kind == ROW_PADDING:
+            bg = self._styles.colors[STYLE_NORMAL][0]
+            return {'text': row.cells[0], 'bg': bg, 'fg': bg,
+                    'font': self._styles.fonts[FONT_PADDING]}
+
+        bg, fg = self._styles.colors[row.style]
+        options = {'bg': bg, 'fg': fg,
+                   'font': self._styles.fonts[FONT_NORMAL]}
+        if row.kind == ROW_HEAD_CLOCK and cell == 1:
+            return options  # shows the clock text variable
+
+        text = row.cells[cell]
+        if text is None:
+            options.update(text="", image=self._arrow)
         else:
-            text = self.texts['untiltext'] + " " if condition_until else ""
-        label_until = get_label_func(text)
-        label_until.configure(anchor=tkinter.E)
-        label_until.grid(column=self._col_arrow, row=row, sticky="NSWE")
-        ls.append(label_until)
-
-        condition_time = "notime" not in event.modifiers
-        text = event.timestring() + " " if condition_time else ""
-        label_time = get_label_func(text)
-        label_time.configure(anchor=tkinter.E)
-        label_time.grid(column=self._col_time, row=row, sticky="NSWE")
-        ls.append(label_time)
-
-        label_text = get_label_func(event.description)
-        label_text.configure(anchor=tkinter.W)
-        label_text.grid(column=self._col_text, columnspan=self._col_count,
-                        row=row, sticky="NSWE")
-        ls.append(label_text)
-
-        ls.append(None)
-
-        self._labels.append(ls)
-
-    def _create_hilight_event_line(self, event: SimpleEvent, row: int) -> None:
-        ls = []
-
-        if "until" not in event.modifiers and self._arrow is not None:
-            label_until = tkinter.Label(self._tk, image=self._arrow)
-            label_until.configure(bg=self.colors['hbg'], fg=self.colors['hfg'])
-        else:
-            condition_until = "until" in event.modifiers
-            text = self.texts['untiltext'] + " " if condition_until else ""
-            label_until = self._get_hilight_label(text)
-        label_until.configure(anchor=tkinter.E)
-        label_until.grid(column=self._col_arrow, row=row, sticky="NSWE")
-        ls.append(label_until)
-
-        condition_time = "notime" not in event.modifiers
-        text = event.timestring() + " " if condition_time else ""
-        label_time = self._get_hilight_label(text)
-        label_time.configure(anchor=tkinter.E)
-        label_time.grid(column=self._col_time, row=row, sticky="NSWE")
-        ls.append(label_time)
-
-        label_text = self._get_hilight_label(event.description)
-        label_text.configure(anchor=tkinter.W)
-        label_text.grid(column=self._col_text,
-                        columnspan=self._col_count-self._col_text, row=row,
-                        sticky="NSWE")
-        ls.append(label_text)
-
-        ls.append(None)
-
-        self._labels.append(ls)
-
-    def _create_padding_line(self, row: int, past: bool = False) -> None:
-        label = self._get_padding_label()
-        if past:
-            label.configure(bg=self.colors['pbg'], fg=self.colors['pbg'])
-        else:
-            label.configure(bg=self.colors['bg'], fg=self.colors['bg'])
+            options.update(text=text, image="")
+        return options
+
+    def _create_row_labels(self, row: Row, index: int) -> List[tkinter.Label]:
+        if row.kind == ROW_HEAD:
+            label = tkinter.Label(self._tk, anchor=tkinter.W)
+            label.grid(columnspan=self._col_count, column=self._col_arrow,
+                       row=index, sticky="NSWE")
+            return [label]
+
+        if row.kind == ROW_HEAD_CLOCK:
+            label = tkinter.Label(self._tk, anchor=tkinter.W)
+            label.grid(columnspan=self._col_count-self._col_arrow-1,
+                       column=self._col_arrow, row=index, sticky="NSWE")
+            label_clock = tkinter.Label(self._tk, anchor=tkinter.E,
+                                        textvariable=self._clock_text)
+            label_clock.grid(column=self._col_clock, row=index, sticky="NSWE")
+            return [label, label_clock]
+
+        if row.kind == ROW_EVENT:
+            label_until = tkinter.Label(self._tk, anchor=tkinter.E)
+            label_until.grid(column=self._col_arrow, row=index, sticky="NSWE")
+            label_time = tkinter.Label(self._tk, anchor=tkinter.E)
+            label_time.grid(column=self._col_time, row=index, sticky="NSWE")
+            label_text = tkinter.Label(self._tk, anchor=tkinter.W)
+            label_text.grid(column=self._col_text,
+                            columnspan=self._col_count-self._col_text,
+                            row=index, sticky="NSWE")
+            return [label_until, label_time, label_text]
+
+        if row.kind == ROW_FOOT:
+            label = tkinter.Label(self._tk, anchor=tkinter.W)
+            label.grid(columnspan=self._col_count, column=self._col_arrow,
+                       row=index, sticky="SWE")
+            return [label]
+
+        label = tkinter.Label(self._tk)
         label.grid(column=self._col_arrow, columnspan=self._col_count,
-                   row=row, sticky="NSWE")
-        self._labels.append([None, None, label, None])
-
-    def _get_events_to_render(self) -> List[SimpleEvent]:
-        today_events = []
-        today_limit = datetime.datetime.now()
-        today_limit = today_limit.replace(hour=23, minute=59, second=59)
-
-        tomorrow_events = []
-        tomorrow_limit = today_limit + datetime.timedelta(days=1)
-
-        with self.footnote_lock:
-            today_count_limit = self.count_today - (len(self.footnotes) - 1)
-
-        with self.event_lock:
-            for event in self.events:
-                if (event.time < today_limit and
-                        len(today_events) < today_count_limit):
-                    today_events.append(event)
-                elif (event.time > today_limit and
-                      event.time < tomorrow_limit and
-                      len(tomorrow_events) < self.count_tomorrow and
-                      "tomorrow" in event.modifiers):
-                    tomorrow_events.append(event)
-                elif event.time > tomorrow_limit:
-                    break
-
-        return today_events, tomorrow_events
-
-    def _find_event_to_hilight(self, events: List[SimpleEvent]) -> SimpleEvent:
-        hilight_event = None
-        limit = datetime.datetime.now()
-        limit = limit - datetime.timedelta(minutes=self.hilight_after)
-        for event in events:
-            if (limit < event.time and
-                    hilight_event is None and
-                    "padding" not in event.modifiers):
-                hilight_event = event
-        return hilight_event
-
-    def _clear_window(self) -> None:
-        for line in self._labels:
-            for element in line:
-                if element is not None:
-                    element.grid_forget()
-                    element.destroy()
-
-        for row in range(self._tk.grid_size()[1]):
-            self._tk.rowconfigure(row, minsize=0, pad=0, weight=0, uniform="")
-
-        for column in range(self._tk.grid_size()[0]):
-            self._tk.columnconfigure(column, minsize=0, pad=0, weight=0,
-                                     uniform="")
-
-        self._tk.grid_columnconfigure(self._col_text, weight=1)
-        self._labels = []
-
-    def _fill_window(self,
-                     today_events: List[SimpleEvent],
-                     tomorrow_events: List[SimpleEvent],
-                     hilight_event: SimpleEvent,  # or None
-                     current_time: datetime.datetime) -> None:
-        self._build_font_string()
-        event_drawn = False
-        row = 0
-
-        if len(self.texts['head']) != 0:
-            self._create_head_line(self.texts['head'], row)
-            row = row + 1
-            if self.pad_head:
-                self._create_padding_line(row)
-                row = row + 1
-
-        if (len(self.texts['today']) != 0 and len(today_events) > 0 or
-                self.show_clock):
-            event_drawn = True
-            if self.show_clock:
-                self._create_head_line_with_clock(self._prepare_today_text(),
-                                                  row)
-            else:
-                self._create_head_line(self._prepare_today_text(), row)
-            row = row + 1
-
-        for event in today_events:
-            event_drawn = True
-            if "padding" in event.modifiers:
-                self._create_padding_line(row)
-            elif event == hilight_event:
-                self._create_hilight_event_line(event, row)
-            elif event.time < current_time:
-                self._create_past_event_line(event, row)
-            else:
-                self._create_normal_event_line(event, row)
-            row = row + 1
-
-        if len(self.texts['tomorrow']) != 0 and len(tomorrow_events) > 0:
-            if event_drawn:
-                self._create_padding_line(row)
-                row = row + 1
-            if not self.tomorrow_before_event:
-                self._create_head_line(self._prepare_tomorrow_text(), row)
-                row = row + 1
-
-        first = True
-        for event in tomorrow_events:
-            if "padding" in event.modifiers:
-                self._create_padding_line(row)
-            elif first and self.tomorrow_before_event:
-                self._create_event_line(event, row, self._get_normal_label,
-                                        until=False, tomorrow=True)
+                   row=index, sticky="NSWE")
+        return [label]
+
+    def _reconcile_rows(self, rows: List[Row]) -> None:
+        # Labels are kept between updates. Only labels of lines that changed
+        # their kind are recreated, all other labels are only configured
+        # with the options that actually changed.
+        for index, row in enumerate(rows):
+            line = self._lines[index] if index < len(self._lines) else None
+            if line is not None and line.row.kind != row.kind:
+                self._destroy_line(line)
+                line = None
+            if line is None:
+                labels = self._create_row_labels(row, index)
+                stats.count("labels created", len(labels))
+                line = _Line(row, labels, [{} for _ in labels])
+
+            for cell, label in enumerate(line.labels):
+                options = self._get_cell_options(row, cell)
+                applied = line.options[cell]
+                changed = {key: value for key, value in options.items()
+                           if key not in applied or applied[key] != value}
+                if changed:
+                    label.configure(**changed)
+                    applied.update(changed)
+
+            line = line._replace(row=row)
+            if index < len(self._lines):
+                self._lines[index] = line
             else:
-                self._create_normal_event_line(event, row)
-            row = row + 1
-
-        with self.footnote_lock:
-            if self.footnotes and self.pad_foot:
-                self._create_padding_line(row)
-                row = row + 1
-
-            first_footnote = True
-            for note in self.footnotes:
-                self._create_foot_line(note, row)
-                if first_footnote:
-                    self._tk.grid_rowconfigure(row, weight=1)
-                    first_footnote = False
-                row = row + 1
-
-        return hilight_event
+                self._lines.append(line)
+
+            # the first footnote sticks to the bottom of the window
+            first_foot = (row.kind == ROW_FOOT and
+                          (index == 0 or rows[index - 1].kind != ROW_FOOT))
+            self._set_row_weight(index, 1 if first_foot else 0)
+
+        for index in range(len(rows), len(self._lines)):
+            self._destroy_line(self._lines[index])
+            self._set_row_weight(index, 0)
+        del self._lines[len(rows):]
+
+    def _set_row_weight(self, index: int, weight: int) -> None:
+        while len(self._row_weights) <= index:
+            self._row_weights.append(0)
+        if self._row_weights[index] != weight:
+            self._tk.grid_rowconfigure(index, weight=weight)
+            self._row_weights[index] = weight
+
+    def _destroy_line(self, line) -> None:
+        for label in line.labels:
+            label.grid_forget()
+            label.destroy()
 
     def mainloop(self) -> None:
-        self._handle_new_events()
-        self._tk.mainloop()
+        # Raises KeyboardInterrupt if ended by SIGINT
+        self._quit_signal = None
+        self._watch_signals()
+        try:
+            self._handle_new_events()
+            self._tk.mainloop()
+        finally:
+            self._unwatch_signals()
+        if self._quit_signal == signal.SIGINT:
+            raise KeyboardInterrupt
 
     def events_changed(self) -> None:
         self._tk.after(0, self._handle_new_events)
@@ -0,0 +1,355 @@
+#!/usr/bin/python3
+
+# Serves the timetables of several displays from one process. Every display
+# has its own config file. Identical event blocks of the config files are
+# parsed once and share one event object, and the occurrences of the events
+# of all displays are kept in one index, so a display that shares most of
+# its events with others costs little extra. Displays fetch their rows over
+# HTTP, see RemoteRenderer. Commands of exec events are not executed by the
+# server. See "./dt_server.py --help"
+
+from dt_config import ConfigCleaner, CleanThread, get_footnotes
+from dt_config import get_preview_days
+from dt_index import OccurrenceIndex, FootnoteIndex
+from dt_index import get_preview_timespan, get_seconds_until_tomorrow
+from dt_layout import TableLayout, HeadlessRenderer, Row
+from dt_stats import stats, log
+from dt_watch import ConfigChangeHandler
+import dt_settings
+
+from watchdog.observers import Observer
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict
+from functools import partial
+from typing import List
+from urllib.parse import quote, unquote
+from urllib.request import urlopen
+from urllib.error import URLError
+from os import path
+import argparse
+import datetime
+import json
+import locale
+import sys
+import threading
+import traceback
+import weakref
+
+
+class Display:
+    # One timetable served by the TimetableServer
+    def __init__(self, name: str, config_path: str, shared_blocks):
+        self.name = name
+        self.config_path = config_path
+        # no cache file: events loaded from it could not be shared
+        self.reader = ConfigCleaner(None, shared_blocks)
+        self.reader_lock = threading.Lock()
+        self.clean_thread = CleanThread(self.reader, self.reader_lock, log)
+        self.config = self.reader.snapshot()
+        self.footnote_index = FootnoteIndex()
+        self.layout = TableLayout()
+        self.preview_days = get_preview_days({})
+        self.positions = {}                 # id(event): position in config
+        self.version = 0                    # increased when rows may change
+
+        # rows laid out last, valid until next_change or a new version
+        self.lock = threading.Lock()
+        self.rows = None
+        self.rows_version = None
+        self.next_change = None
+
+    def update_positions(self) -> None:
+        # Occurrences at the same time are shown in the order of the config
+        sources = self.config.recurring + self.config.unique
+        self.positions = {id(source): position
+                          for position, source in enumerate(sources)}
+
+    def get_rows(self, now: datetime.datetime) -> tuple:
+        # Returns the rows, their version and when they change next
+        with self.lock:
+            if (self.rows is None or self.rows_version != self.version or
+                    now >= self.next_change):
+                self.rows_version = self.version
+                self.rows, self.next_change = self.layout.layout(now)
+            return self.rows, self.rows_version, self.next_change
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    # GET /                 {"displays": [names]}
+    # GET /displays/<name>  {"name", "version", "rows", "next_change"}
+    def do_GET(self) -> None:
+        timetables = self.server.timetables
+        parts = [unquote(part)
+                 for part in self.path.split('?')[0].split('/') if part]
+        if not parts:
+            data = {"displays": timetables.get_display_names()}
+        elif len(parts) == 2 and parts[0] == "displays":
+            data = timetables.get_display_state(parts[1])
+        else:
+            data = None
+
+        if data is None:
+            self.send_error(404)
+            return
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass  # displays poll regularly, do not log every request
+
+
+class TimetableServer:
+    def __init__(self, config_paths: List[str], host: str, port: int):
+        log("Timetable server started.")
+        self._shared_blocks = weakref.WeakValueDictionary()
+        self._displays = OrderedDict()      # name: Display
+        for config_path in config_paths:
+            if not path.isfile(config_path):
+                raise Exception("Wrong config file given: " + config_path)
+            name = path.splitext(path.basename(config_path))[0]
+            if name in self._displays:
+                raise Exception("Two config files for display " + name)
+            self._displays[name] = Display(name, path.abspath(config_path),
+                                           self._shared_blocks)
+
+        # The update thread sleeps until a config changes, the date changes
+        # or the server stops. Both are guarded by _wakeup.
+        self._wakeup = threading.Condition()
+        self._changed = set(self._displays)  # names, all are loaded first
+        self._stopping = False
+
+        self._index = OccurrenceIndex()
+        self._index.build([], *self._get_preview_timespan())
+        self._cleaned_date = datetime.date.today()
+
+        log("Starting file monitor thread...")
+        self._observer = Observer()
+        for display in self._displays.values():
+            handler = ConfigChangeHandler(
+                    display.config_path,
+                    lambda name=display.name: self._notify_config_change(name),
+                    dt_settings.filewatch_quiet_period_s
+                    )
+            self._observer.schedule(handler,
+                                    path.dirname(display.config_path))
+
+        self._http = ThreadingHTTPServer((host, port), _RequestHandler)
+        self._http.daemon_threads = True
+        self._http.timetables = self
+
+        self._update_thread = threading.Thread(target=self._update_loop)
+
+    @property
+    def port(self) -> int:
+        return self._http.server_address[1]
+
+    def get_display_names(self) -> List[str]:
+        return list(self._displays)
+
+    def get_display_state(self, name: str,
+                          now: datetime.datetime = None) -> dict:
+        # None if there is no such display
+        display = self._displays.get(name)
+        if display is None:
+            return None
+        rows, version, next_change = display.get_rows(
+            now or datetime.datetime.now())
+        return {"name": name, "version": version,
+                "rows": [row._asdict() for row in rows],
+                "next_change": next_change.isoformat()}
+
+    def _get_preview_timespan(self) -> tuple:
+        # covers the preview of every display
+        return get_preview_timespan(max(
+            [d.preview_days for d in self._displays.values()], default=2))
+
+    def _notify_config_change(self, name: str) -> None:
+        with self._wakeup:
+            self._changed.add(name)
+            self._wakeup.notify()
+
+    def _load_display(self, display: Display) -> bool:
+        # Returns whether the config of the display changed
+        log("Config change detected for {}. Reparsing...".format(
+            display.name))
+        try:
+            with display.reader_lock, stats.measure("parse"):
+                config = display.reader.parse(display.config_path,
+                                              dt_settings.fileencoding)
+        except Exception:
+            log("!!! Error: Could not parse config file of " + display.name)
+            traceback.print_exc()
+            return False
+
+        if config == display.config:
+            log("Config did not change.")
+            return False
+
+        display.config = config
+        display.footnote_index.build(config.footnotes)
+        display.layout.apply_general(config.general)
+        display.preview_days = get_preview_days(config.general)
+        display.update_positions()
+        return True
+
+    def _update_index(self) -> None:
+        # One index for the events of all displays, each event only once
+        sources = OrderedDict()
+        for display in self._displays.values():
+            for source in display.config.recurring + display.config.unique:
+                sources.setdefault(id(source), source)
+        with stats.measure("index"):
+            self._index.update(list(sources.values()))
+            self._index.advance(*self._get_preview_timespan())
+
+    def _update_display(self, display: Display) -> None:
+        t1, t2 = get_preview_timespan(display.preview_days)
+        events = self._index.events_between(t1, t2, display.positions)
+        footnotes = get_footnotes(display.config, display.footnote_index,
+                                  datetime.date.today())
+        display.layout.set_events(events)
+        with display.layout.footnote_lock:
+            display.layout.footnotes = footnotes
+        with display.lock:
+            display.version += 1
+        log("{}: {} events, {} footnotes.".format(
+            display.name, len(events), len(footnotes)))
+
+    def _wait_for_work(self) -> tuple:
+        # Returns the names of the changed displays and whether the date
+        # changed, or None to stop.
+        with self._wakeup:
+            while True:
+                if self._stopping:
+                    return None
+                date_changed = datetime.date.today() > self._cleaned_date
+                if self._changed or date_changed:
+                    break
+                self._wakeup.wait(min(get_seconds_until_tomorrow(),
+                                      dt_settings.updatethread_max_wait_s))
+
+            changed = self._changed
+            self._changed = set()
+            return changed, date_changed
+
+    def _update_loop(self) -> None:
+        while True:
+            work = self._wait_for_work()
+            if work is None:
+                return
+            changed, date_changed = work
+
+            changed = [display for name, display in self._displays.items()
+                       if name in changed and self._load_display(display)]
+
+            if date_changed:
+                log("Date change detected. Cleaning config files...")
+                # Each display is reloaded once its file is cleaned
+                for display in self._displays.values():
+                    display.clean_thread.start(
+                        display.config_path, dt_settings.fileencoding,
+                        partial(self._notify_config_change, display.name))
+                self._cleaned_date = datetime.date.today()
+                changed = list(self._displays.values())
+
+            if changed:
+                self._update_index()
+                with stats.measure("update"):
+                    for display in changed:
+                        self._update_display(display)
+
+    def start(self) -> None:
+        self._observer.start()
+        self._update_thread.start()
+
+    def serve_forever(self) -> None:
+        log("Serving {} displays on port {}.".format(
+            len(self._displays), self.port))
+        try:
+            self._http.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    def stop(self) -> None:
+        # after serve_forever returned, or from another thread
+        threading.Thread(target=self._http.shutdown).start()
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+        log("Waiting for the update thread to finish...")
+        self._update_thread.join()
+        self._observer.stop()
+        self._http.server_close()
+        log("Stats: " + stats.summary())
+
+
+class RemoteRenderer(HeadlessRenderer):
+    # Prints a display of a TimetableServer to the console. The rows are
+    # fetched again when the server says they change, but at least every
+    # poll_interval seconds to notice config changes.
+    def __init__(self, url: str, name: str, output=sys.stdout,
+                 poll_interval: float = 60):
+        HeadlessRenderer.__init__(self, output)
+        self._url = url.rstrip('/') + "/displays/" + quote(name)
+        self._poll_interval = datetime.timedelta(seconds=poll_interval)
+
+    def fetch(self) -> dict:
+        with urlopen(self._url, timeout=10) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def layout(self, now: datetime.datetime) -> tuple:
+        next_poll = now + self._poll_interval
+        try:
+            data = self.fetch()
+        except (URLError, OSError, ValueError) as e:
+            print("!!! Could not fetch the display: " + str(e),
+                  file=sys.stderr)
+            return self.rows, next_poll
+
+        rows = [Row(row["kind"], row["style"], tuple(row["cells"]))
+                for row in data["rows"]]
+        next_change = datetime.datetime.fromisoformat(data["next_change"])
+        return rows, min(next_change, next_poll)
+
+
+def main():
+    locale.setlocale(locale.LC_ALL, '')  # apply system locale
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("configs", nargs="*", metavar="CONFIG",
+                        help="config file of a display, the display is "
+                             "named like the file without extension")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to serve on")
+    parser.add_argument("--port", type=int, default=8080,
+                        help="port to serve on")
+    parser.add_argument("--client", metavar="NAME",
+                        help="instead of serving, print display NAME of the "
+                             "server at --url")
+    parser.add_argument("--url", default="http://127.0.0.1:8080",
+                        help="server to fetch from with --client")
+    args = parser.parse_args()
+
+    if args.client is not None:
+        renderer = RemoteRenderer(args.url, args.client)
+        try:
+            renderer.mainloop()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if not args.configs:
+        parser.error("no config files given")
+    server = TimetableServer(args.configs, args.host, args.port)
+    server.start()
+    server.serve_forever()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
 #!/usr/bin/python3
 
 filename = "config.cfg"
-updatethread_sleeptime_s = 0.5
+updatethread_max_wait_s = 3600
+renderer_max_wait_s = 600
+filewatch_quiet_period_s = 0.5
+stats_log_interval_s = 3600
+execution_max_wait_s = 60
+execution_max_processes = 2
+execution_timeout_s = 300
 fileencoding = "utf-8-sig"
+cachesuffix = ".cache"  # None: do not cache the parsed config
+webhost = ""  # address the web renderer listens on, "": all
 dateformat = "{d:%A}, {d.day}. {d:%B} {d.year}"
 clockformat = "{dt.hour}:{dt.minute:02d}"
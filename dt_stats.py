@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+
+# Timing and counting instrumentation. The modules record into the shared
+# instance "stats", the timetable logs a summary of it now and then.
+# Times of nested measurements are also part of the outer ones.
+
+from contextlib import contextmanager
+import datetime
+import threading
+import time
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}  # name: [count, total seconds, max seconds]
+        self._counters = {}  # name: count
+
+    @contextmanager
+    def measure(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.perf_counter() - start)
+
+    def add_timing(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                self._timings[name] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def get_timings(self) -> dict:
+        # name: (count, total seconds, max seconds)
+        with self._lock:
+            return {name: tuple(timing)
+                    for name, timing in self._timings.items()}
+
+    def get_counters(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+
+    def summary(self) -> str:
+        parts = []
+        for name, (count, total, longest) in sorted(
+                self.get_timings().items()):
+            parts.append("{} {}x {:.1f}/{:.1f} ms".format(
+                name, count, total / count * 1000, longest * 1000))
+        for name, count in sorted(self.get_counters().items()):
+            parts.append("{} {}".format(name, count))
+        if not parts:
+            return "nothing recorded"
+        return "avg/max: " + ", ".join(parts)
+
+
+def log(s: str) -> None:
+    # Log line of the timetable and the server
+    print(datetime.datetime.now().strftime("[%d.%m %H:%M:%S] ") + s)
+
+
+stats = Stats()
@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+# Watching the config file for changes
+
+from watchdog.events import FileSystemEventHandler, FileModifiedEvent
+from watchdog.events import FileCreatedEvent, FileMovedEvent
+
+import hashlib
+import threading
+from os import path
+
+
+class ConfigChangeHandler(FileSystemEventHandler):
+    # Calls callback when the content of the config file changed and the
+    # file was left alone for quiet_period seconds since. Editors often save
+    # in several writes or by renaming a new file to the config file, this
+    # still causes only one call.
+    def __init__(self, filename, callback, quiet_period):
+        FileSystemEventHandler.__init__(self)
+        self._path = path.abspath(filename)
+        self._callback = callback
+        self._quiet_period = quiet_period
+        self._lock = threading.Lock()
+        self._timer = None
+        self._content_hash = self._get_content_hash()
+
+    def _get_content_hash(self) -> str:
+        try:
+            with open(self._path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None  # e.g. while the file is replaced
+
+    def _restart_timer(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self._quiet_period, self._check)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _check(self) -> None:
+        content_hash = self._get_content_hash()
+        with self._lock:
+            if content_hash is None or content_hash == self._content_hash:
+                return
+            self._content_hash = content_hash
+        self._callback()
+
+    def _is_config_file(self, event, file_path: str) -> bool:
+        return (not event.is_directory and
+                path.abspath(file_path) == self._path)
+
+    def on_modified(self, event: FileModifiedEvent) -> None:
+        if self._is_config_file(event, event.src_path):
+            self._restart_timer()
+
+    def on_created(self, event: FileCreatedEvent) -> None:
+        if self._is_config_file(event, event.src_path):
+            self._restart_timer()
+
+    def on_moved(self, event: FileMovedEvent) -> None:
+        # another file was renamed to the config file
+        if self._is_config_file(event, event.dest_path):
+            self._restart_timer()
@@ -0,0 +1,297 @@
+#!/usr/bin/python3
+
+# Renderer showing the table in web browsers. Serves a page that receives
+# the rows by Server-Sent Events: first all of them, then only the rows that
+# changed. The selection and layout of the rows is the one of TableLayout.
+
+from dt_layout import HeadlessRenderer, Row
+import dt_settings
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+import datetime
+import json
+import mimetypes
+import threading
+
+# Seconds after which a comment is sent to connections without changes, so
+# closed connections are noticed
+_keepalive_s = 15
+
+_page = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Timetable</title>
+<style>
+html, body { margin: 0; height: 100%; overflow: hidden; }
+table { width: 100%; height: 100%; border-collapse: collapse; }
+tr { height: 1px; }
+tr.first-foot { height: 100%; }
+td { padding: 0; white-space: pre; vertical-align: bottom; }
+td.right { text-align: right; }
+td.text { width: 100%; }
+tr.padding { visibility: hidden; }
+</style>
+<style id="look"></style>
+</head>
+<body>
+<table><tbody id="rows"></tbody></table>
+<script>
+"use strict";
+var tbody = document.getElementById("rows");
+var clockText = "";
+
+function cell(text, className, colspan) {
+    var td = document.createElement("td");
+    td.className = className;
+    td.colSpan = colspan;
+    if (text === null) {
+        var img = document.createElement("img");
+        img.src = "arrow";
+        td.appendChild(img);
+    } else {
+        td.textContent = text;
+    }
+    return td;
+}
+
+function makeRow(row) {
+    var tr = document.createElement("tr");
+    tr.className = row.kind + " " + row.style;
+    var c = row.cells;
+    if (row.kind === "event") {
+        tr.appendChild(cell(c[0], "right", 1));
+        tr.appendChild(cell(c[1], "right", 1));
+        tr.appendChild(cell(c[2], "text", 2));
+    } else if (row.kind === "headclock") {
+        tr.appendChild(cell(c[0], "text", 3));
+        tr.appendChild(cell(clockText, "right clock", 1));
+    } else {
+        tr.appendChild(cell(c[0], "text", 4));
+    }
+    return tr;
+}
+
+function markFirstFoot() {
+    // the first footnote sticks to the bottom of the window
+    var previous = null;
+    for (var tr of tbody.children) {
+        var first = tr.classList.contains("foot") &&
+            (previous === null || !previous.classList.contains("foot"));
+        tr.classList.toggle("first-foot", first);
+        previous = tr;
+    }
+}
+
+function setLook(look) {
+    var c = look.colors, f = look.font;
+    var font = (f.italics ? "italic " : "") + (f.bold ? "bold " : "") +
+        f.size + "pt " + JSON.stringify(f.name);
+    document.getElementById("look").textContent =
+        "body { background: " + c.bg + "; font: " + font + "; " +
+        (f.underlined ? "text-decoration: underline; " : "") + "}\\n" +
+        "tr.normal { background: " + c.bg + "; color: " + c.fg + "; }\\n" +
+        "tr.past { background: " + c.pbg + "; color: " + c.pfg + "; }\\n" +
+        "tr.hilight { background: " + c.hbg + "; color: " + c.hfg + "; }\\n" +
+        "tr.padding { font-size: " + f.paddingsize + "pt; }\\n";
+}
+
+function apply(message) {
+    if (message.look) {
+        setLook(message.look);
+    }
+    if (message.clock !== undefined) {
+        clockText = message.clock;
+        for (var td of tbody.querySelectorAll("td.clock")) {
+            td.textContent = clockText;
+        }
+    }
+    if (message.rows) {
+        while (tbody.children.length > message.length) {
+            tbody.removeChild(tbody.lastChild);
+        }
+        // integer keys are visited in ascending order
+        for (var index in message.rows) {
+            var tr = makeRow(message.rows[index]);
+            var old = tbody.children[index];
+            if (old) {
+                tbody.replaceChild(tr, old);
+            } else {
+                tbody.appendChild(tr);
+            }
+        }
+        markFirstFoot();
+    }
+}
+
+var source = new EventSource("events");
+source.onopen = function() {
+    // every connection starts with all rows
+    tbody.textContent = "";
+};
+source.onmessage = function(event) {
+    apply(JSON.parse(event.data));
+};
+</script>
+</body>
+</html>
+"""
+
+
+def diff_rows(old: List[Row], new: List[Row]) -> dict:
+    # The rows of new that differ from old, by index, and the new length
+    changed = {str(index): row._asdict() for index, row in enumerate(new)
+               if index >= len(old) or old[index] != row}
+    return {"length": len(new), "rows": changed}
+
+
+def _get_clock_text(now: datetime.datetime) -> str:
+    return dt_settings.clockformat.format(dt=now)
+
+
+class _WebRequestHandler(BaseHTTPRequestHandler):
+    # GET /        the page
+    # GET /events  the rows as event stream, see _send_events
+    # GET /rows    the current rows as JSON
+    # GET /arrow   the arrow image, if set
+    def do_GET(self) -> None:
+        renderer = self.server.renderer
+        location = self.path.split('?')[0]
+        if location == "/":
+            self._send(_page.encode("utf-8"), "text/html; charset=utf-8")
+        elif location == "/events":
+            self._send_events(renderer)
+        elif location == "/rows":
+            update = renderer.wait_for_update(None, 0)
+            if update is None:
+                self.send_error(404)
+                return
+            data = [row._asdict() for row in update[1]]
+            self._send(json.dumps(data).encode("utf-8"), "application/json")
+        elif location == "/arrow" and renderer.arrow_path is not None:
+            try:
+                with open(renderer.arrow_path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                self.send_error(404)
+                return
+            content_type = mimetypes.guess_type(renderer.arrow_path)[0]
+            self._send(data, content_type or "application/octet-stream")
+        else:
+            self.send_error(404)
+
+    def _send(self, body: bytes, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_events(self, renderer) -> None:
+        # Every message is a JSON object. After a change of the rows it
+        # contains the new version, the number of rows and the changed
+        # rows, after a change of colors or font also "look". "clock" is
+        # sent when the clock text changes.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        version, rows, look, clock = None, [], None, None
+        try:
+            while True:
+                now = datetime.datetime.now()
+                next_minute = 60 - now.second - now.microsecond / 1e6
+                update = renderer.wait_for_update(
+                    version, min(next_minute, _keepalive_s))
+                if update is None:
+                    return
+                new_version, new_rows, new_look = update
+
+                message = {}
+                if new_version != version:
+                    message = diff_rows(rows, new_rows)
+                    message["version"] = new_version
+                    if new_look != look:
+                        message["look"] = new_look
+                new_clock = _get_clock_text(datetime.datetime.now())
+                if new_clock != clock:
+                    message["clock"] = new_clock
+
+                if message:
+                    self.wfile.write(
+                        ("data: " + json.dumps(message) + "\n\n").encode(
+                            "utf-8"))
+                else:
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+                version, rows, look, clock = (new_version, new_rows,
+                                              new_look, new_clock)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the browser went away
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class WebRenderer(HeadlessRenderer):
+    # Lays out the rows like HeadlessRenderer, but instead of printing them
+    # publishes them to the connected browsers.
+    def __init__(self, host: str, port: int):
+        HeadlessRenderer.__init__(self, output=None)
+        self.arrow_path = None
+
+        # rows, look and version of both, guarded by _published
+        self._published = threading.Condition()
+        self._look = None
+        self._version = 0
+        self._stopping = False
+
+        self._http = ThreadingHTTPServer((host, port), _WebRequestHandler)
+        self._http.daemon_threads = True
+        self._http.renderer = self
+
+    @property
+    def port(self) -> int:
+        return self._http.server_address[1]
+
+    def load_arrow_image(self, path) -> None:
+        HeadlessRenderer.load_arrow_image(self, path)
+        self.arrow_path = path
+
+    def render(self, now: datetime.datetime = None) -> datetime.datetime:
+        # Returns the time of the next necessary render
+        rows, next_render = self.layout(now or datetime.datetime.now())
+        look = {"colors": dict(self.colors), "font": dict(self.font)}
+        with self._published:
+            if rows != self.rows or look != self._look:
+                self.rows = rows
+                self._look = look
+                self._version += 1
+                self._published.notify_all()
+        return next_render
+
+    def wait_for_update(self, version, timeout: float) -> tuple:
+        # Waits at most timeout seconds for a version other than the given
+        # one. Returns the current (version, rows, look) or None when
+        # stopping.
+        with self._published:
+            if self._version == version and not self._stopping:
+                self._published.wait(timeout)
+            if self._stopping:
+                return None
+            return self._version, self.rows, self._look
+
+    def mainloop(self) -> None:
+        server_thread = threading.Thread(target=self._http.serve_forever,
+                                         daemon=True)
+        server_thread.start()
+        try:
+            HeadlessRenderer.mainloop(self)
+        finally:
+            with self._published:
+                self._stopping = True
+                self._published.notify_all()
+            self._http.shutdown()
+            self._http.server_close()
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+# Tests of reading and writing config files. Run with
+# "python3 -m unittest".
+
+from dt_config import ConfigCleaner, ConfigReader
+from dt_event import UniqueTime
+
+import os
+import shutil
+import tempfile
+import unittest
+
+_directory = os.path.dirname(os.path.abspath(__file__))
+_example = os.path.join(_directory, "example.cfg")
+_test_data = os.path.join(_directory, "test_data")
+
+
+class ConfigReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "config.cfg")
+        with open(_example, encoding="utf-8") as f:
+            self.text = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text: str) -> None:
+        with open(self.filename, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def test_failed_parse_keeps_events(self):
+        # saving a typo and then the fixed file reuses all parsed events
+        reader = ConfigReader()
+        self.write(self.text)
+        config = reader.parse(self.filename, "utf-8")
+
+        self.write(self.text.replace("8:00 1 2 3", "8:00 1 x 3"))
+        with self.assertRaises(Exception):
+            reader.parse(self.filename, "utf-8")
+
+        self.write(self.text + "\n")
+        fixed = reader.parse(self.filename, "utf-8")
+        self.assertEqual(len(fixed.recurring), len(config.recurring))
+        for old, new in zip(config.recurring + config.unique,
+                            fixed.recurring + fixed.unique):
+            self.assertIs(old, new)
+
+    def test_clean_drops_past_dates_from_cache(self):
+        # the cleaned config, also when loaded from the cache file, is the
+        # same as a fresh parse of the cleaned file. An exec line without
+        # offset would be written as an empty line, so it gets one.
+        self.write(self.text.replace("12:30-14.05.2022", "12:30-14.05.2099")
+                   .replace("\necho ", "\n+0 echo "))
+        cleaner = ConfigCleaner(".cache")
+        cleaner.clean(self.filename, "utf-8")
+
+        def unique_times(config):
+            return [event.get_unique_times() for event in config.unique]
+
+        fresh = ConfigReader().parse(self.filename, "utf-8")
+        cached = ConfigReader(".cache").parse(self.filename, "utf-8")
+        future = [UniqueTime(14, 5, 2099, 12, 30)]
+        self.assertEqual(unique_times(fresh), [future, future])
+        self.assertEqual(unique_times(cleaner.snapshot()),
+                         unique_times(fresh))
+        self.assertEqual(unique_times(cached), unique_times(fresh))
+        self.assertEqual([e.description for e in cached.recurring],
+                         [e.description for e in fresh.recurring])
+
+    def test_clean_writes_through_symlink(self):
+        shared = os.path.join(self.directory, "shared")
+        os.mkdir(shared)
+        target = os.path.join(shared, "room.cfg")
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(self.text.replace("\necho ", "\n+0 echo "))
+        os.symlink(target, self.filename)
+        ConfigCleaner(".cache").clean(self.filename, "utf-8")
+
+        self.assertTrue(os.path.islink(self.filename))
+        self.assertEqual(os.listdir(shared), ["room.cfg"])
+        with open(target, encoding="utf-8") as f:
+            self.assertNotIn("30.09.2016", f.read())
+
+class ConfigWriterTest(unittest.TestCase):
+    def test_matches_golden_file(self):
+        # writer.golden.cfg was written by the writer before its rewrite
+        # from writer.cfg. Dates before 2099 are past.
+        reader = ConfigCleaner()
+        reader.parse(os.path.join(_test_data, "writer.cfg"), "utf-8")
+        lines = reader._build_lines(reader.general, reader.recurring,
+                                    reader.unique, reader.footnotes)
+        with open(os.path.join(_test_data, "writer.golden.cfg"),
+                  encoding="utf-8") as f:
+            self.assertEqual('\n'.join(lines), f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
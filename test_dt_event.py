@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+# Compares the arithmetic occurrences of recurring events with the day by
+# day scan they replaced. Run with "python3 -m unittest".
+
+from dt_config import ConfigReader
+from dt_event import Event, RecurringEvent, RecurringTime
+
+from datetime import datetime, timedelta
+import random
+import unittest
+
+
+class RecurringEventTest(unittest.TestCase):
+    def test_matches_scan(self):
+        rng = random.Random(1)
+        conditions = (RecurringEvent.CONDITION_NONE,
+                      RecurringEvent.CONDITION_EVEN,
+                      RecurringEvent.CONDITION_ODD)
+        for _ in range(500):
+            event = RecurringEvent()
+            for _ in range(rng.randint(1, 4)):
+                event.add_recurring_time(RecurringTime(
+                    rng.randint(1, 7), rng.randrange(24),
+                    rng.randrange(0, 60, 5), rng.choice(conditions)))
+            # Occurrences are always computed from midnight on. The scan
+            # skips the last day for other start times. Also covers ISO
+            # years with 53 weeks, e.g. 2020 and 2026.
+            start = datetime(2019, 12, 1) + timedelta(
+                days=rng.randrange(8 * 365))
+            end = start + timedelta(days=rng.choice((1, 7, 14, 60, 400)))
+            self.assertEqual(event.get_next_datetimes(start, end),
+                             event._get_next_datetimes_scan(start, end))
+
+    def test_day_of_week_out_of_range(self):
+        reader = ConfigReader()
+        for line in ("10:00 8", "10:00 0", "10:00 g9"):
+            with self.assertRaises(Exception):
+                reader._parse_recurring_event_times(line)
+        event = reader._parse_recurring_event_times("10:00 1 u7")
+        self.assertEqual([t.dow for t in event.get_recurring_times()], [1, 7])
+
+    def test_modifier_flags(self):
+        flags = {"notime": Event.FLAG_NOTIME, "until": Event.FLAG_UNTIL,
+                 "tomorrow": Event.FLAG_TOMORROW,
+                 "padding": Event.FLAG_PADDING, "exec": Event.FLAG_EXEC,
+                 "nodraw": Event.FLAG_NODRAW,
+                 "noremove": Event.FLAG_NOREMOVE,
+                 "yearly": Event.FLAG_YEARLY}
+        self.assertEqual(sorted(Event.VALID_MODIFIERS), sorted(flags))
+        for modifier, flag in flags.items():
+            event = Event()
+            event.modifiers = [modifier]
+            self.assertEqual(event.get_modifier_flags(), flag)
+        event = Event()
+        event.modifiers = list(reversed(Event.VALID_MODIFIERS))
+        self.assertEqual(event.get_modifier_flags(), sum(flags.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
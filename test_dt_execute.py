@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+
+# Tests of running executed commands. Run with "python3 -m unittest".
+
+from dt_execute import ExecutionEvent, ExecutionPool
+
+import datetime
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+
+class ExecutionTest(unittest.TestCase):
+    def setUp(self):
+        # a script that starts a child and waits for it, like sound.sh
+        self.directory = tempfile.mkdtemp()
+        self.pid_file = os.path.join(self.directory, "child.pid")
+        self.script = os.path.join(self.directory, "play.sh")
+        with open(self.script, "w") as f:
+            f.write("#!/bin/sh\nsleep 30 &\necho $! > {}\nwait\n".format(
+                self.pid_file))
+        os.chmod(self.script, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_child_pid(self) -> int:
+        for _ in range(100):
+            if os.path.exists(self.pid_file):
+                with open(self.pid_file) as f:
+                    text = f.read().strip()
+                if text:
+                    return int(text)
+            time.sleep(0.05)
+        self.fail("the script did not start its child")
+
+    def assert_ended(self, pid: int) -> None:
+        # the child is not waited for by us, it may be a zombie briefly
+        for _ in range(100):
+            try:
+                with open("/proc/{}/stat".format(pid)) as f:
+                    if f.read().split(")")[-1].split()[0] == "Z":
+                        return
+            except FileNotFoundError:
+                return
+            time.sleep(0.05)
+        self.fail("process {} still runs".format(pid))
+
+    def test_timeout_kills_children(self):
+        event = ExecutionEvent(datetime.datetime.now(), self.script)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            event.execute(0.5)
+        self.assert_ended(self.get_child_pid())
+
+    def test_stop_drops_queued_and_kills_running(self):
+        pool = ExecutionPool(1, 300, log=lambda s: None)
+        pool.start()
+        now = datetime.datetime.now()
+        for _ in range(3):
+            pool.submit(ExecutionEvent(now, self.script))
+        child = self.get_child_pid()
+
+        begin = time.monotonic()
+        pool.stop()
+        self.assertLess(time.monotonic() - begin, 5)
+        self.assert_ended(child)
+
+
+if __name__ == "__main__":
+    unittest.main()
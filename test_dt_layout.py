@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+
+# Compares the selection of the events to show with the pruning the
+# renderer did before, over random events and settings. Run with
+# "python3 -m unittest".
+
+from dt_event import Event, SimpleEvent
+from dt_layout import TableLayout
+
+import datetime
+import random
+import unittest
+
+
+def _select_events_reference(layout: TableLayout, events: list,
+                             now: datetime.datetime) -> tuple:
+    # The former _remove_past_events, _get_events_to_render and
+    # _find_event_to_hilight of the renderer, working on a copy. nodraw
+    # events are left out first: they used to be counted as past events
+    # only until the first redraw removed them.
+    events = [e for e in events if not e.flags & Event.FLAG_NODRAW]
+
+    limit = now - datetime.timedelta(minutes=layout.hilight_after)
+    today_morning = now.replace(hour=0, minute=0)
+    today_evening = now.replace(hour=23, minute=59)
+    events = [e for e in events if e.time >= today_morning]
+    past_event_count = len([e for e in events if e.time < limit])
+    left_today = [e for e in events if e.time <= today_evening]
+    to_remove = []
+    for event in events:
+        if past_event_count <= layout.count_past:
+            break
+        if len(left_today) - len(to_remove) <= layout.count_today:
+            break
+        if event.time < limit and not event.flags & Event.FLAG_NOREMOVE:
+            to_remove.append(event)
+            past_event_count -= 1
+    events = [e for e in events if e not in to_remove]
+
+    today_limit = now.replace(hour=23, minute=59, second=59)
+    tomorrow_limit = today_limit + datetime.timedelta(days=1)
+    today_count_limit = layout.count_today - (len(layout.footnotes) - 1)
+    today_events = []
+    tomorrow_events = []
+    for event in events:
+        if (event.time < today_limit and
+                len(today_events) < today_count_limit):
+            today_events.append(event)
+        elif (today_limit < event.time < tomorrow_limit and
+              len(tomorrow_events) < layout.count_tomorrow and
+              event.flags & Event.FLAG_TOMORROW):
+            tomorrow_events.append(event)
+        elif event.time > tomorrow_limit:
+            break
+
+    hilight_event = None
+    for event in today_events:
+        if limit < event.time and not event.flags & Event.FLAG_PADDING:
+            hilight_event = event
+            break
+    return today_events, tomorrow_events, hilight_event
+
+
+class SelectEventsTest(unittest.TestCase):
+    def test_matches_reference(self):
+        rng = random.Random(3)
+        flags = (0, 0, Event.FLAG_NOREMOVE, Event.FLAG_NODRAW,
+                 Event.FLAG_PADDING, Event.FLAG_TOMORROW,
+                 Event.FLAG_TOMORROW | Event.FLAG_NOREMOVE,
+                 Event.FLAG_NODRAW | Event.FLAG_NOREMOVE)
+        base = datetime.datetime(2024, 5, 10)
+        for _ in range(5000):
+            events = sorted(
+                (SimpleEvent(base + datetime.timedelta(
+                     minutes=rng.randrange(-1440, 3 * 1440)),
+                     str(i), rng.choice(flags))
+                 for i in range(rng.randint(0, 30))),
+                key=lambda e: e.time)
+            layout = TableLayout()
+            layout.count_past = rng.choice((0, 1, 3, 999))
+            layout.count_today = rng.choice((0, 2, 5, 10))
+            layout.count_tomorrow = rng.choice((0, 1, 2, 5))
+            layout.hilight_after = rng.choice((0, 10, 60))
+            layout.footnotes = ["note"] * rng.randint(0, 2)
+            layout.set_events(events)
+            now = base + datetime.timedelta(
+                minutes=rng.randrange(1440), seconds=rng.randrange(60))
+
+            today, tomorrow, hilight_index = layout.select_events(now)
+            hilight = None if hilight_index is None else today[hilight_index]
+            self.assertEqual((today, tomorrow, hilight),
+                             _select_events_reference(layout, events, now))
+
+
+if __name__ == "__main__":
+    unittest.main()
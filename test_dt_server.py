@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+
+# Serves two displays sharing most of their events and compares what the
+# server returns with the layout of each config on its own. Run with
+# "python3 -m unittest".
+
+from dt_benchmark import make_config_text
+from dt_config import ConfigReader, get_footnotes
+from dt_index import OccurrenceIndex, FootnoteIndex
+from dt_layout import TableLayout, Row
+from dt_server import TimetableServer
+import dt_settings
+
+from urllib.request import urlopen
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+
+def _layout_config(filename: str, now: datetime.datetime) -> list:
+    # The rows of the config file without the server, as dt_main lays
+    # them out
+    config = ConfigReader().parse(filename, dt_settings.fileencoding)
+    t1 = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    t2 = t1 + datetime.timedelta(days=5)
+    index = OccurrenceIndex()
+    index.build(list(config.recurring + config.unique), t1, t2)
+    footnote_index = FootnoteIndex()
+    footnote_index.build(config.footnotes)
+    layout = TableLayout()
+    layout.apply_general(config.general)
+    layout.set_events(index.events_between(t1, t2))
+    layout.footnotes = get_footnotes(config, footnote_index, t1.date())
+    return layout.layout(now)[0]
+
+
+class TimetableServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        today = datetime.datetime.now().replace(hour=0, minute=0, second=0,
+                                                microsecond=0)
+        text = make_config_text(60, 200, 10, 3, today, seed=2)
+        # b has one more recurring event and shows fewer events
+        self.paths = {}
+        for name, replacements in (
+                ("a", ()),
+                ("b", (("[recurring]\n",
+                        "[recurring]\n0:05 1 2 3 4 5 6 7\nOnly b\n\n"),
+                       ("todaycount = 8", "todaycount = 5")))):
+            self.paths[name] = os.path.join(self.directory, name + ".cfg")
+            with open(self.paths[name], "w", encoding="utf-8") as f:
+                for old, new in replacements:
+                    text = text.replace(old, new)
+                f.write(text)
+
+        self.server = TimetableServer(
+            [self.paths["a"], self.paths["b"]], "127.0.0.1", 0)
+        self.server.start()
+        self.http_thread = threading.Thread(target=self.server.serve_forever)
+        self.http_thread.start()
+
+        displays = self.server._displays.values()
+        deadline = time.monotonic() + 10
+        while any(display.version == 0 for display in displays):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+
+    def tearDown(self):
+        self.server.stop()
+        self.http_thread.join()
+        shutil.rmtree(self.directory)
+
+    def fetch(self, name: str) -> list:
+        url = "http://127.0.0.1:{}/displays/{}".format(self.server.port,
+                                                       name)
+        with urlopen(url, timeout=10) as response:
+            data = json.loads(response.read().decode("utf-8"))
+        return [Row(row["kind"], row["style"], tuple(row["cells"]))
+                for row in data["rows"]]
+
+    def test_shared_events(self):
+        a = self.server._displays["a"].config
+        b = self.server._displays["b"].config
+        self.assertEqual(len(b.recurring), len(a.recurring) + 1)
+        for event_a, event_b in zip(a.recurring + a.unique,
+                                    b.recurring[1:] + b.unique):
+            self.assertIs(event_a, event_b)
+
+    def test_rows_match_layout_of_config(self):
+        for name, filename in self.paths.items():
+            # the rows may change between the requests at a full minute
+            before = _layout_config(filename, datetime.datetime.now())
+            rows = self.fetch(name)
+            after = _layout_config(filename, datetime.datetime.now())
+            self.assertIn(rows, (before, after))
+        self.assertNotEqual(self.fetch("a"), self.fetch("b"))
+
+    def test_date_change_cleans_and_reloads(self):
+        def past_times(display):
+            return [t for event in display.config.unique
+                    for t in event.get_unique_times()
+                    if datetime.datetime(*t[2::-1], *t[3:]) < now]
+
+        now = datetime.datetime.now()
+        displays = list(self.server._displays.values())
+        self.assertTrue(all(past_times(display) for display in displays))
+        with self.server._wakeup:
+            self.server._cleaned_date -= datetime.timedelta(days=1)
+            self.server._wakeup.notify()
+
+        deadline = time.monotonic() + 10
+        while any(past_times(display) for display in displays):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+        for display in displays:
+            self.assertTrue(os.path.isfile(display.config_path + ".bak"))
+            self.assertEqual(self.fetch(display.name),
+                             _layout_config(display.config_path,
+                                            datetime.datetime.now()))
+
+
+if __name__ == "__main__":
+    unittest.main()
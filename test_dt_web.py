@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+# Runs the web renderer and checks that browsers get the rows and, after a
+# change of the events, only the rows that changed. Run with
+# "python3 -m unittest".
+
+from dt_event import SimpleEvent
+from dt_web import WebRenderer
+
+import datetime
+import http.client
+import json
+import threading
+import unittest
+
+
+class WebRendererTest(unittest.TestCase):
+    def setUp(self):
+        now = datetime.datetime.now()
+        if now.time() >= datetime.time(23, 50):
+            # the events would pass or the date change during the test
+            self.skipTest("too close to midnight")
+        evening = now.replace(hour=23, minute=55, second=0, microsecond=0)
+        self.events = [SimpleEvent(evening + datetime.timedelta(minutes=i),
+                                   "Event " + str(i)) for i in range(4)]
+        self.renderer = WebRenderer("127.0.0.1", 0)
+        self.renderer.set_events(self.events)
+        self.thread = threading.Thread(target=self.renderer.mainloop)
+        self.thread.start()
+        self.assertIsNotNone(self.renderer.wait_for_update(0, 10))
+
+    def tearDown(self):
+        self.renderer.quit()
+        self.thread.join()
+
+    def get(self, location: str) -> http.client.HTTPResponse:
+        connection = http.client.HTTPConnection("127.0.0.1",
+                                                self.renderer.port,
+                                                timeout=10)
+        connection.request("GET", location)
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        return response
+
+    def read_message(self, response: http.client.HTTPResponse) -> dict:
+        # the next message with rows, skipping keepalives and clock updates
+        while True:
+            lines = []
+            while True:
+                line = response.fp.readline().decode("utf-8")
+                self.assertTrue(line)
+                if line == "\n":
+                    break
+                lines.append(line)
+            if lines[0].startswith("data: "):
+                message = json.loads("".join(lines)[len("data: "):])
+                if "version" in message:
+                    return message
+
+    def test_rows_and_changes(self):
+        rows = json.loads(self.get("/rows").read().decode("utf-8"))
+        self.assertEqual(rows, json.loads(json.dumps(
+            [row._asdict() for row in self.renderer.rows])))
+        changed = [index for index, row in enumerate(rows)
+                   if "Event 2" in row["cells"]]
+        self.assertEqual(len(changed), 1)
+
+        events = self.get("/events")
+        message = self.read_message(events)
+        self.assertEqual(message["length"], len(rows))
+        self.assertEqual(list(message["rows"].values()), rows)
+
+        self.events[2] = SimpleEvent(self.events[2].time, "Changed")
+        self.renderer.set_events(self.events)
+        self.renderer.events_changed()
+        message = self.read_message(events)
+        self.assertEqual(message["length"], len(rows))
+        self.assertEqual(list(message["rows"]), [str(changed[0])])
+        self.assertIn("Changed", message["rows"][str(changed[0])]["cells"])
+        events.close()
+
+
+if __name__ == "__main__":
+    unittest.main()